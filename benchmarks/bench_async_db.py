@@ -0,0 +1,55 @@
+# 并发查询测试：对比逐条执行与通过 AsyncDB 同时执行多条独立查询的耗时
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sylfk.async_db import AsyncDB
+from sylfk.db_driver import SQLiteDriver
+from sylfk.dbconnector import BaseDB
+
+
+class SlowSQLiteDriver(SQLiteDriver):
+    """注册 sleep 函数，模拟有网络延迟的查询"""
+
+    def _open(self, path):
+        conn = super()._open(path)
+        conn.create_function('sleep', 1, lambda seconds: time.sleep(seconds) or seconds)
+        return conn
+
+
+def main(queries=8, latency=0.02):
+    # 内存数据库只允许一个连接，使用数据库文件
+    db = BaseDB(None, None, driver=SlowSQLiteDriver(tempfile.mkdtemp()), pool_max_size=queries)
+    db.create_db('bench')
+    db.choose_db('bench')
+    adb = AsyncDB(db)
+    sql = 'SELECT sleep({})'.format(latency)
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        db.execute(sql)
+    print('{:<10} {:>8.1f} ms'.format('serial', (time.perf_counter() - start) * 1000))
+
+    async def run():
+        return await adb.gather(*(adb.execute(sql) for _ in range(queries)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    assert all(result.success for result in results)
+    print('{:<10} {:>8.1f} ms'.format('gather', (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    results = adb.parallel(*[sql] * queries)
+    assert all(result.success for result in results)
+    print('{:<10} {:>8.1f} ms'.format('parallel', (time.perf_counter() - start) * 1000))
+
+    adb.close()
+    db.close()
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
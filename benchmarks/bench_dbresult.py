@@ -0,0 +1,63 @@
+# 查询结果内存占用测试：对比每行一个字典与紧凑结果集 ResultSet
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sylfk.dbconnector import ResultSet
+
+COLUMNS = ('id', 'f_name', 'email', 'age', 'created')
+
+
+def make_values(count):
+    """模拟驱动读取的每行数据"""
+    for i in range(count):
+        yield i, 'user_{}'.format(i), 'user_{}@example.com'.format(i), i % 100, '2020-01-01 00:00:00'
+
+
+def build_dicts(count):
+    """DictCursor 的结果，每行一个字典"""
+    return [dict(zip(COLUMNS, values)) for values in make_values(count)]
+
+
+def build_compact(count):
+    """紧凑模式的结果，共享字段名，每行一个元组"""
+    return ResultSet(COLUMNS, tuple(make_values(count)))
+
+
+def measure(build, count):
+    # 内存和耗时分开测量，tracemalloc 会拖慢执行
+    start = time.perf_counter()
+    build(count)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = build(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main(count=100000):
+    # 两种结果包含同样的值，差别在于行容器本身的开销
+    dicts, dict_size, dict_time = measure(build_dicts, count)
+    compact, compact_size, compact_time = measure(build_compact, count)
+
+    print('{} rows x {} columns'.format(count, len(COLUMNS)))
+    print('{:<10} {:>10.2f} MB {:>10.1f} ms'.format('dict', dict_size / 2 ** 20, dict_time * 1000))
+    print('{:<10} {:>10.2f} MB {:>10.1f} ms'.format('compact', compact_size / 2 ** 20,
+                                                 compact_time * 1000))
+
+    # 按字段名逐行读取的速度
+    for name, rows in (('dict', dicts), ('compact', compact)):
+        start = time.perf_counter()
+        for row in rows:
+            row['f_name']
+        print('{:<10} {:>10.1f} ms  row[\'f_name\'] x {}'.format(
+            name, (time.perf_counter() - start) * 1000, count))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,70 @@
+# 请求调度性能测试：hello world 路由函数与视图类的每秒处理请求数
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder
+
+from core.base_view import BaseView
+from sylfk import SYLFK
+from sylfk.view import Controller
+from sylfk.wsgi_adapter import LazyRequest
+
+
+class Hello(BaseView):
+    """通过 BaseView 的请求方法映射表调度，复用同一个实例"""
+    reuse_instance = True
+
+    def get(self, request, *args, **options):
+        return 'Hello World'
+
+
+class HelloFresh(Hello):
+    """每次请求创建新实例"""
+    reuse_instance = False
+
+
+def build_app():
+    app = SYLFK()
+
+    @app.route('/')
+    def index():
+        return 'Hello World'
+
+    app.load_controller(Controller('bench', [
+        {'url': '/view', 'view': Hello, 'endpoint': 'hello'},
+        {'url': '/fresh', 'view': HelloFresh, 'endpoint': 'fresh'},
+    ]))
+    return app
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def main(number=20000):
+    app = build_app()
+    for path in ('/', '/view', '/fresh'):
+        environ = EnvironBuilder(path=path,
+                                 headers={'Cookie': 'session_id=bench'}).get_environ()
+
+        def hit():
+            # 每次请求复制一份 environ，避免被上一次请求修改
+            body = app(dict(environ), start_response)
+            b''.join(body)
+
+        seconds = timeit.timeit(hit, number=number)
+        print('{:<8} wsgi     {:>10.0f} req/s {:>8.2f} us/req'.format(
+            path, number / seconds, seconds / number * 1e6))
+
+        # 与 wsgi_app 一样每次请求创建 LazyRequest，只统计框架自身的调度开销
+        seconds = timeit.timeit(lambda: app.dispatch_request(LazyRequest(dict(environ))),
+                                number=number)
+        print('{:<8} dispatch {:>10.0f} req/s {:>8.2f} us/req'.format(
+            path, number / seconds, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# 路由匹配性能测试：规则数量增长时，单次匹配耗时应基本保持不变
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sylfk.route import Router
+
+
+def build_router(count):
+    """生成包含 count 条静态规则和 count 条参数规则的路由树"""
+    router = Router()
+    for i in range(count):
+        router.add('/static_{}/page'.format(i), 'static_{}'.format(i))
+        router.add('/user_{}/<int:id>/profile'.format(i), 'user_{}'.format(i))
+    router.add('/files/<path:rest>', 'files')
+    return router
+
+
+def main(number=100000):
+    print('{:>8} {:>14} {:>14} {:>14}'.format('rules', 'static(us)', 'int(us)', 'path(us)'))
+    for count in (10, 100, 1000, 10000):
+        router = build_router(count)
+        last = count - 1
+        cases = (
+            '/static_{}/page'.format(last),
+            '/user_{}/42/profile'.format(last),
+            '/files/a/b/c.txt',
+        )
+        costs = []
+        for path in cases:
+            assert router.match(path) is not None, path
+            seconds = timeit.timeit(lambda: router.match(path), number=number)
+            costs.append(seconds / number * 1e6)
+        print('{:>8} {:>14.3f} {:>14.3f} {:>14.3f}'.format(count * 2 + 1, *costs))
+
+
+if __name__ == '__main__':
+    main()
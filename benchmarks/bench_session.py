@@ -0,0 +1,43 @@
+# 会话写入性能测试：对比每次 push 同步写文件与延迟批量写入
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sylfk.session import session
+
+
+class FakeRequest:
+    """只带 session_id Cookie 的请求对象"""
+
+    def __init__(self, session_id):
+        self.cookies = {'session_id': session_id}
+
+
+def run(requests, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        for request in requests:
+            session.push(request, 'user', 'user_{}'.format(i))
+    return len(requests) * rounds / (time.perf_counter() - start)
+
+
+def main(users=1000, rounds=5):
+    requests = [FakeRequest('bench_{}'.format(i)) for i in range(users)]
+
+    session.set_storage_path(tempfile.mkdtemp())
+    print('{:<14} {:>10.0f} push/s'.format('sync', run(requests, rounds)))
+
+    session.set_storage_path(tempfile.mkdtemp())
+    session.set_write_behind(True, interval=0.5)
+    print('{:<14} {:>10.0f} push/s'.format('write-behind', run(requests, rounds)))
+
+    start = time.perf_counter()
+    session.stop_flusher()
+    print('{:<14} {:>10.3f} s'.format('final flush', time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
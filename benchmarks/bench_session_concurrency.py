@@ -0,0 +1,66 @@
+# 会话并发压力测试：多个线程同时修改同一个会话和不同会话，检查是否丢失更新
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sylfk.session import session
+
+
+class FakeRequest:
+    """只带 session_id Cookie 的请求对象"""
+
+    def __init__(self, session_id):
+        self.cookies = {'session_id': session_id}
+
+
+def increment(current_session):
+    current_session['count'] = current_session.get('count', 0) + 1
+    return True
+
+
+def worker(index, rounds, barrier):
+    shared = FakeRequest('shared')
+    own = FakeRequest('own_{}'.format(index))
+    barrier.wait()
+    for i in range(rounds):
+        # 同一个会话上的读-改-写
+        session.modify(shared, increment, create=True)
+        # 同一个会话的不同字段
+        session.push(shared, 'thread_{}'.format(index), i)
+        # 各自独立的会话
+        session.modify(own, increment, create=True)
+
+
+def run(threads, rounds):
+    barrier = threading.Barrier(threads)
+    workers = [threading.Thread(target=worker, args=(i, rounds, barrier))
+               for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    seconds = time.perf_counter() - start
+
+    shared = session.get(FakeRequest('shared'))
+    assert shared['count'] == threads * rounds, shared['count']
+    for i in range(threads):
+        assert shared['thread_{}'.format(i)] == rounds - 1
+        assert session.get_item(FakeRequest('own_{}'.format(i)), 'count') == rounds
+    return threads * rounds * 3 / seconds
+
+
+def main(threads=32, rounds=2000):
+    session.set_storage_path(tempfile.mkdtemp())
+    session.set_write_behind(True, interval=0.2)
+    ops = run(threads, rounds)
+    session.stop_flusher()
+    print('{} threads x {} rounds: no lost updates, {:.0f} ops/s'.format(threads, rounds, ops))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# 模板渲染性能测试：对比逐个 str.replace 的旧实现与编译缓存后的实现
+import os
+import re
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sylfk.template_engine import replace_template
+
+
+def legacy_replace_template(app, path, **options):
+    """旧实现：每次读文件、编译正则，每个标记做一次全文替换"""
+    content = '<h1>Not Found Tmeplate.</h1>'
+    path = os.path.join(app.template_folder, path)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            content = f.read().decode()
+        args = re.compile(r'{{(.*?)}}').findall(content) or ()
+        if options:
+            for arg in args:
+                key = arg.strip()
+                old_value = '{{{{{}}}}}'.format(arg)
+                new_value = str(options.get(key, ''))
+                content = content.replace(old_value, new_value)
+    return content
+
+
+def main(placeholders=500, number=200):
+    folder = tempfile.mkdtemp()
+
+    class App:
+        template_folder = folder
+
+    # 生成包含大量标记的模板，每个标记周围有一段普通文本
+    rows = ['<tr><td>row {0}</td><td>{{{{ field_{0} }}}}</td></tr>'.format(i)
+            for i in range(placeholders)]
+    with open(os.path.join(folder, 'bench.html'), 'w') as f:
+        f.write('<table>\n{}\n</table>'.format('\n'.join(rows)))
+    options = {'field_{}'.format(i): 'value {}'.format(i) for i in range(placeholders)}
+
+    assert legacy_replace_template(App, 'bench.html', **options) == \
+        replace_template(App, 'bench.html', **options)
+
+    for name, func in (('legacy', legacy_replace_template), ('compiled', replace_template)):
+        seconds = timeit.timeit(lambda: func(App, 'bench.html', **options), number=number)
+        print('{:<10} {:>10.1f} us/render'.format(name, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
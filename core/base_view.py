@@ -22,10 +22,15 @@ class BaseView(View):
         """
         处理请求的核心函数，该函数会被视图函数调用
         """
-        if request.method in self.methods:
-            # request.method.lower() 返回请求方法的小写字符串
-            func = getattr(self, request.method.lower())
-            return func(request, *args, **options)
+        # 从预先生成的映射表中取出请求方法对应的处理函数
+        # 映射表是类属性，只使用本类自己的，不能沿用父类生成的映射表
+        cls = type(self)
+        meta = cls.__dict__.get('methods_meta')
+        if meta is None:
+            meta = cls.build_methods_meta()
+        func = meta.get(request.method)
+        if func is not None:
+            return func(self, request, *args, **options)
         return '<h1>Unknown or unsupported require method.</h1>'
 
 
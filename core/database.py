@@ -1,6 +1,7 @@
 import sys
 import os
 from sylfk.dbconnector import BaseDB
+from sylfk.db_driver import MySQLDriver, SQLiteDriver
 
 
 db_user = 'root'
@@ -8,8 +9,17 @@ db_password = "123456".encode("utf8")
 # db_password = os.environ.get('MYSQL_PWD') or '123456'  # 密码
 db_database = 'shiyanlou'
 
+# 通过环境变量 SYLFK_DB_DRIVER 选择数据库驱动，为 sqlite 时不需要 MySQL 服务器
+# 数据库文件存放在环境变量 SYLFK_DB_DIR 指定的目录中，默认为当前目录
+if os.environ.get('SYLFK_DB_DRIVER', 'mysql') == 'sqlite':
+    db_driver = SQLiteDriver(os.environ.get('SYLFK_DB_DIR', '.'))
+    id_column = 'id INTEGER PRIMARY KEY AUTOINCREMENT'
+else:
+    db_driver = MySQLDriver()
+    id_column = 'id INT PRIMARY KEY  AUTO_INCREMENT'
+
 try:
-    dbconn = BaseDB(db_user, db_password, db_database)
+    dbconn = BaseDB(db_user, db_password, db_database, driver=db_driver)
 except Exception as e:
     code, _ = e.args
 
@@ -20,16 +30,16 @@ except Exception as e:
         exit()
 
     # 获取一个没有数据库的连接对象
-    dbconn = BaseDB(db_user, db_password)
+    dbconn = BaseDB(db_user, db_password, driver=db_driver)
     # 创建数据库，返回一个 DBResult 对象
     ret = dbconn.create_db(db_database)
 
     # 定义创建数据表的语句
     create_table = '''
         CREATE TABLE user (
-            id INT PRIMARY KEY  AUTO_INCREMENT,
-            f_name VARCHAR(50) UNIQUE 
-            )'''
+            {},
+            f_name VARCHAR(50) UNIQUE
+            )'''.format(id_column)
 
     # 如果创建成功，切换到数据库中
     if ret.success:
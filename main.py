@@ -6,7 +6,7 @@ from sylfk import SYLFK, simple_template
 
 from sylfk.session import session
 
-from sylfk import redirect, render_json, render_file
+from sylfk import redirect, render_json, render_file, stream_csv, stream_json
 
 from core.database import dbconn
 
@@ -15,6 +15,9 @@ from sylfk import exceptions, ERROR_MAP, content_type
 
 # 首页视图
 class Index(SessionView):
+    # 不在实例上保存请求状态，可以复用同一个实例
+    reuse_instance = True
+
     def get(self, request, *args, **options):
         # 获取当前会话中的 user 的值
         user = session.get_item(request, 'user')
@@ -24,6 +27,8 @@ class Index(SessionView):
 
 # 登录视图
 class Login(BaseView):
+    reuse_instance = True
+
     def get(self, request, *args, **options):
         # 从 GET 请求中获取 state 参数，如果不存在则返回默认值 1
         state = request.args.get('state', "1")
@@ -33,8 +38,8 @@ class Login(BaseView):
 
     def post(self, request, *args, **options):
         # 把用户提交的信息到数据库中进行查询
-        sql = "SELECT * FROM user WHERE user.f_name = '{}'".format(request.form['user'])
-        ret = dbconn.execute(sql)
+        sql = "SELECT * FROM user WHERE user.f_name = %(user)s"
+        ret = dbconn.execute(sql, {'user': request.form['user']})
         # 如果有匹配结果，说明注册过，反之再次重定向登录页面
         if ret.rows == 1:
             # 获取第一条数据的 f_name 字段为用户名
@@ -49,6 +54,8 @@ class Login(BaseView):
 
 # 登出视图
 class Logout(SessionView):
+    reuse_instance = True
+
     def get(self, request, *arges, **options):
         # 从当前会话中删除 user
         session.pop(request, 'user')
@@ -57,6 +64,8 @@ class Logout(SessionView):
 
 
 class API(BaseView):
+    reuse_instance = True
+
     def get(self, request, *args, **options):
         data = {
             'name': 'shiyanlou_001',
@@ -67,11 +76,27 @@ class API(BaseView):
 
 
 class Download(BaseView):
+    reuse_instance = True
+
     def get(self, request, *args, **options):
         return render_file("main.py")
 
 
+# 导出用户列表视图，数据边查询边发送
+class Export(BaseView):
+    reuse_instance = True
+
+    def get(self, request, *args, **options):
+        rows = dbconn.iter_query("SELECT id, f_name FROM user ORDER BY id")
+        # 通过 format 参数选择导出格式，默认导出 CSV 文件
+        if request.args.get('format') == 'json':
+            return stream_json(rows)
+        return stream_csv(rows, fields=['id', 'f_name'], file_name='user.csv')
+
+
 class Register(BaseView):
+    reuse_instance = True
+
     def get(self, request, *args, **options):
         # 收到 GET 请求是通过模板返回一个注册页面
         return simple_template("layout.html", title="注册", message="输入注册用户名")
@@ -79,8 +104,9 @@ class Register(BaseView):
     def post(self, request, *args, **options):
         # 把用户提交的信息作为参数
         # 执行 SQL 的 INSERT 语句把信息保存到数据库的表中
-        sql = "INSERT INTO user(user.f_name) VALUE('{}')".format(request.form['user'])
-        ret = dbconn.insert(sql)
+        # 使用参数占位符，MySQL 和 SQLite 都支持这种写法
+        sql = "INSERT INTO user(f_name) VALUES (%(user)s)"
+        ret = dbconn.insert(sql, {'user': request.form['user']})
         # 如果添加成功，则表示注册成功，重定向到登录页面
         if ret.success:
             return redirect("/login")
@@ -120,6 +146,11 @@ syl_url_map = [
         'view': Download,
         'endpoint': 'download'
     },
+    {
+        'url': '/export',
+        'view': Export,
+        'endpoint': 'export'
+    },
     {
         'url': '/register',
         'view': Register,
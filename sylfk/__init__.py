@@ -11,12 +11,18 @@ import sylfk.exceptions as exceptions
 
 from sylfk.helper import parse_static_key
 
-from sylfk.route import Route
+from sylfk.route import Route, Router
 
-from sylfk.template_engine import replace_template
+from sylfk.static import COMPRESS_TYPES, IMMUTABLE_CACHE_CONTROL, FileResponse, \
+    StaticCache, accepts_gzip, is_not_modified, static_manifest
+
+from sylfk.template_engine import replace_template, stream_replace_template, \
+    precompile_templates, load_compiled_templates, save_compiled_templates
 
 from sylfk.session import create_session_id, session
 
+import csv
+import io
 import json
 
 
@@ -32,6 +38,8 @@ ERROR_MAP = {
                     content_type=content_type, status=401),
     '404': Response('<h1>404 Source Not Found.</h1>',
                     content_type=content_type, status=404),
+    '500': Response('<h1>500 Internal Server Error.</h1>',
+                    content_type=content_type, status=500),
     '503': Response('<h1>503 Unknown function type.</h1>',
                     content_type=content_type, status=503),
 }
@@ -39,19 +47,40 @@ ERROR_MAP = {
 # 文件类型及其代号的映射关系
 TYPE_MAP = {
     'css': 'text/css',
-    'js': 'text/css',
+    'js': 'application/javascript',
+    'html': 'text/html',
+    'json': 'application/json',
+    'svg': 'image/svg+xml',
     'png': 'image/png',
     'jpg': 'image/jpeg',
     'jpeg': 'image/jpeg'
 }
 
 
-# 处理函数数据结构
+# 处理函数数据结构，注册时预先生成调度计划，请求时不再做类型判断和函数内省
 class ExecFunc:
-    def __init__(self, func, func_type, **options):
+    __slots__ = ('func', 'options', 'func_type', 'methods', 'call')
+
+    def __init__(self, func, func_type, params=(), **options):
         self.func = func  # 处理函数
         self.options = options  # 附带参数
         self.func_type = func_type  # 函数类型
+        self.methods = None  # 支持的请求方法集合，None 表示由处理函数自行判断
+        self.call = None  # 调用入口，参数为请求对象和路径参数字典
+
+        if func_type == 'route':
+            self.methods = frozenset(options.get('methods') or ())
+            # 判断视图函数的执行是否需要请求对象 request 参与
+            # argcount 的值是视图函数的位置参数 + 默认参数的数量之和
+            # 除去路径参数后还有剩余，说明需要 request
+            if func.__code__.co_argcount > len(params):
+                self.call = lambda request, kw: func(request, **kw)
+            else:
+                self.call = lambda request, kw: func(**kw)
+        elif func_type == 'view':
+            # 所有视图函数都需要附带请求头获取处理结果
+            # 路径参数作为 options 传给视图类的 dispatch_request
+            self.call = lambda request, kw: func(request, **kw)
 
 
 class SYLFK:
@@ -65,11 +94,17 @@ class SYLFK:
         self.host = '127.0.0.1'  # 默认主机
         self.port = 8080  # 默认端口
         self.url_map = {}  # 存放 URL 与 Endpoint 的映射
+        self.router = Router()  # 由 URL 规则编译成的路由树
         self.static_map = {}  # 存放 URL 与静态资源的映射
         self.function_map = {}  # 存放 Endpoint 与请求处理函数的映射
         # 静态资源本地存放路径，默认放在应用所在目录的 static 文件夹下
         self.static_folder = static_folder
+        self.static_cache = StaticCache()  # 静态资源缓存，stats() 可查看命中情况
         self.route = Route(self)  # 路由装饰器
+        # 启动时是否预先编译全部模板
+        self.template_precompile = False
+        # 模板编译结果的持久化目录，设置后启动时优先从中加载
+        self.template_cache_dir = None
 
     # 启动入口
     def run(self, host=None, port=None, **options):
@@ -87,12 +122,30 @@ class SYLFK:
         self.function_map['static'] = ExecFunc(func=self.dispatch_static,
                                                func_type='static')
 
-        # 加载本地缓存的 session 记录
-        session.load_all_session()
+        # 预先编译模板，避免每个模板的第一次请求读取和解析文件
+        if self.template_precompile:
+            self.compile_templates()
+
+        # 加载静态资源指纹清单
+        static_manifest.load(self.static_folder)
+
+        # 会话在第一次访问时才从本地文件加载，启动时不再全部读取
 
         # 把框架本身也就是应用本身和其他几个配置参数传给werkzeug的run_simple方法
         run_simple(hostname=self.host, port=self.port, application=self, **options)
 
+    # 模板预编译
+    def compile_templates(self):
+        """
+        编译模板目录下的全部模板，设置了 template_cache_dir 时先加载再保存编译结果
+        """
+        if self.template_cache_dir:
+            load_compiled_templates(self.template_cache_dir)
+        count = precompile_templates(self.template_folder)
+        if self.template_cache_dir:
+            save_compiled_templates(self.template_cache_dir)
+        return count
+
     # 添加路由规则
     @exceptions.capture(ERROR_MAP)
     def add_url_rule(self, url, func, func_type, endpoint='', **kw):
@@ -108,25 +161,69 @@ class SYLFK:
         if endpoint in self.function_map and func_type != 'static':
             raise exceptions.EndpointExistsError
 
+        # 编译进路由树，结构相同的规则会在这里抛出 URLExistsError
+        params = self.router.add(url, endpoint)
+
         # 添加 URL 与节点映射
         self.url_map[url] = endpoint
 
         # 添加节点与请求处理函数映射
-        self.function_map[endpoint] = ExecFunc(func, func_type, **kw)
+        self.function_map[endpoint] = ExecFunc(func, func_type, params, **kw)
 
     # 处理静态资源相关请求，返回响应对象
     @exceptions.capture(ERROR_MAP)
-    def dispatch_static(self, static_path):
-        # 如果静态文件路径不存在，返回异常
-        if not os.path.exists(static_path):
+    def dispatch_static(self, static_path, request=None):
+        # 带指纹的路径还原为真实文件，其内容不会变化，可以长期缓存
+        real_path = static_manifest.resolve(static_path)
+        immutable = real_path is not None
+        if immutable:
+            static_path = real_path
+
+        # 从缓存中获取文件，如果静态文件路径不存在，返回异常
+        try:
+            static_file = self.static_cache.get(static_path)
+        except OSError:
+            raise exceptions.PageNotFoundError
+
+        # 文件在生成清单后被修改过，指纹对应的旧内容已不存在
+        if immutable and not static_manifest.is_current(static_path, static_file.size,
+                                                        static_file.mtime_ns):
             raise exceptions.PageNotFoundError
 
         key = parse_static_key(static_path)  # 文件代号
         file_type = TYPE_MAP.get(key, 'text/plain')  # 文件类型
 
-        with open(static_path, 'rb') as f:
-            data = f.read()
-        return Response(data, content_type=file_type)
+        # 校验报头，客户端据此发起条件请求
+        headers = {
+            'ETag': static_file.etag,
+            'Last-Modified': static_file.last_modified,
+        }
+        if immutable:
+            headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+
+        if key in COMPRESS_TYPES:
+            # 响应内容随 Accept-Encoding 变化，通知中间缓存区分存储
+            headers['Vary'] = 'Accept-Encoding'
+            # 客户端支持 gzip 且有不旧于原文件的预压缩文件时，直接发送压缩文件
+            if request is not None and accepts_gzip(request.environ):
+                try:
+                    gz_file = self.static_cache.get(static_path + '.gz')
+                except OSError:
+                    gz_file = None
+                # 按纳秒比较，秒级时间会把同一秒内修改过的原文件当作比压缩文件旧
+                if gz_file is not None and gz_file.mtime_ns >= static_file.mtime_ns:
+                    static_path, static_file = gz_file.path, gz_file
+                    headers['ETag'] = gz_file.etag
+                    headers['Content-Encoding'] = 'gzip'
+
+        # 客户端缓存仍然有效，返回不带响应体的 304
+        if request is not None and is_not_modified(request.environ, static_file):
+            return Response(status=304, headers=headers)
+
+        # 超出缓存单文件上限的大文件以流的方式发送
+        if static_file.data is None:
+            return FileResponse(static_path, content_type=file_type, headers=headers)
+        return Response(static_file.data, content_type=file_type, headers=headers)
 
     # 处理请求，返回响应对象
     @exceptions.capture(ERROR_MAP)
@@ -136,65 +233,55 @@ class SYLFK:
         # 这里自定义为 Haha Web 0.1
         headers = {'Server': 'Haha Web 0.1'}
 
-        # 从 URL 中提取路径
-        url = request.base_url.replace(request.host_url, '/')
+        # 请求路径
+        url = request.path
 
         # 从请求中取出 Cookie
         cookies = request.cookies
         if 'session_id' not in cookies:
             headers['Set-Cookie'] = 'session_id={}'.format(create_session_id())
 
-        # 如果路径以静态资源目录开头，则请求的是静态资源，节点为 'static'
+        # 如果路径以静态资源目录开头，则请求的是静态资源
+        # 静态资源返回的是一个预先封装好的响应体，直接返回
         if url.startswith('/' + self.static_folder + '/'):
-            endpoint = 'static'
-            url = url[1:]
-        else:
-            # 从映射表中获取节点
-            endpoint = self.url_map.get(url, None)
+            return self.function_map['static'].func(url[1:], request)
 
-        # 如果节点为空，返回异常
-        if endpoint is None:
+        # 从路由树中匹配节点和路径参数，如果匹配不到，返回异常
+        matched = self.router.match(url)
+        if matched is None:
             raise exceptions.PageNotFoundError
+        endpoint, params = matched
 
         # 获取节点对应的执行函数
         exec_function = self.function_map[endpoint]
 
-        # 判断执行函数类型作进一步处理
-        if exec_function.func_type == 'route':
-            # 判断请求方法是否支持
-            if request.method in exec_function.options.get('methods'):
-                # 判断视图函数的执行是否需要请求对象 request 参与
-                # argcount 的值是视图函数的位置参数 + 默认参数的数量之和
-                argcount = exec_function.func.__code__.co_argcount
-                if argcount > 0:
-                    # 需要附带请求体进行结果处理
-                    rep = exec_function.func(request)
-                else:
-                    rep = exec_function.func()
-            else:
-                # 抛出请求方法不支持异常
-                raise exceptions.InvalidRequestMethodError
-
-        elif exec_function.func_type == 'view':
-            # 所有视图函数都需要附带请求头获取处理结果
-            rep = exec_function.func(request)
+        # 判断请求方法是否支持
+        if exec_function.methods is not None and \
+                request.method not in exec_function.methods:
+            # 抛出请求方法不支持异常
+            raise exceptions.InvalidRequestMethodError
 
-        elif exec_function.func_type == 'static':
-            # 静态资源返回的是一个预先封装好的响应体，直接返回
-            return exec_function.func(url)
-        else:
-            # 返回 503 错误
+        # 未知的函数类型没有调用入口，返回 503 错误
+        if exec_function.call is None:
             raise exceptions.UnknownFuncError
 
+        rep = exec_function.call(request, params)
+
         # 定义响应体类型
         content_type = 'text/html; charset=UTF-8'
 
         if isinstance(rep, Response):
-            return rep
+            response = rep
+        else:
+            # 封装响应体，视图返回生成器时逐块发送，不设置 Content-Length，由服务器分块传输
+            response = Response(rep, content_type=content_type, headers=headers,
+                                status=status)
+
+        # 无状态会话模式下，把修改过的会话数据写回 Cookie
+        session.save_cookie(request, response)
 
         # 返回响应体
-        return Response(rep, content_type=content_type, headers=headers,
-                        status=status)
+        return response
 
     # 添加视图规则
     def bind_view(self, url, view_class, endpoint):
@@ -224,14 +311,105 @@ class SYLFK:
         return wsgi_app(self, environ, start_response)
 
 
-def simple_template(path, **options):
+def simple_template(path, _cache=None, **options):
     """
     模板引擎接口
     :param path: 模板文件相对于模板目录 templates 的路径
+    :param _cache: 是否缓存渲染结果，为 True 时使用默认有效期，为数字时表示有效期秒数，
+        加下划线前缀避免与模板变量重名
     :param options: 视图函数提供的传入模板文件的键值对
     """
 
-    return replace_template(SYLFK, path, **options)
+    return replace_template(SYLFK, path, _cache=_cache, **options)
+
+
+def stream_template(path, **options):
+    """
+    流式模板引擎接口，返回的生成器可以直接作为视图的返回值
+    :param path: 模板文件相对于模板目录 templates 的路径
+    :param options: 视图函数提供的传入模板文件的键值对，值为迭代器时逐项输出
+    """
+
+    return stream_replace_template(SYLFK, path, **options)
+
+
+def stream_csv(rows, fields=None, file_name=None, chunk_size=16384):
+    """
+    流式 CSV 响应接口，逐块发送数据，内存占用与数据行数无关
+    :param rows: 数据行的迭代器，如 BaseDB.iter_query 的返回值，每行为字典或元组
+    :param fields: 表头字段，为空时使用第一行字典的键，元组行不输出表头
+    :param file_name: 下载文件名，为空时浏览器直接显示
+    :param chunk_size: 每次发送的块大小，单位字节
+    """
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        keys = fields
+        first = True
+        for row in rows:
+            if isinstance(row, dict):
+                if keys is None:
+                    keys = list(row)
+                if first:
+                    writer.writerow(keys)
+                writer.writerow([row.get(key) for key in keys])
+            else:
+                if first and keys is not None:
+                    writer.writerow(keys)
+                writer.writerow(row)
+            first = False
+            # 攒够一块再发送，避免逐行发送太多小块
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        if first and keys is not None:
+            writer.writerow(keys)
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    headers = {}
+    if file_name:
+        headers['Content-Disposition'] = 'attachment; filename="{}"'.format(file_name)
+
+    return Response(generate(), content_type='text/csv; charset=UTF-8', headers=headers)
+
+
+def stream_json(rows, chunk_size=16384):
+    """
+    流式 JSON 响应接口，把数据行逐块输出为一个 JSON 数组
+    :param rows: 数据行的迭代器，如 BaseDB.iter_query 的返回值
+    :param chunk_size: 每次发送的块大小，单位字节
+    """
+
+    def generate():
+        parts = ['[']
+        size = 1
+        separator = ''
+        for row in rows:
+            # 日期、Decimal 等类型转换为字符串
+            item = separator + json.dumps(row, default=str)
+            separator = ','
+            parts.append(item)
+            size += len(item)
+            if size >= chunk_size:
+                yield ''.join(parts).encode()
+                parts = []
+                size = 0
+        parts.append(']')
+        yield ''.join(parts).encode()
+
+    return Response(generate(), content_type='application/json; charset=UTF-8')
+
+
+def static_url(name):
+    """
+    静态资源 URL 接口，清单中有记录时返回带指纹的 URL，可作为参数传给模板
+    :param name: 相对于静态资源目录的文件名，如 test.js
+    """
+
+    return static_manifest.url_for(name)
 
 
 def redirect(url, status_code=302):
@@ -282,9 +460,6 @@ def render_file(file_path, file_name=None):
     if not os.access(file_path, os.R_OK):
         raise exceptions.RequireReadPermissionError
 
-    with open(file_path, 'rb') as f:
-        content = f.read()
-
     # 如果没有设置文件名，则以路径最后一项为文件名
     filename = file_name or file_path.split('/')[-1]
 
@@ -293,5 +468,6 @@ def render_file(file_path, file_name=None):
         'Content-Disposition': 'attachment; filename={}'.format(filename)
     }
 
-    return Response(content, headers=headers, status=200)
+    # 以流的方式发送文件内容，内存占用与文件大小无关
+    return FileResponse(file_path, headers=headers)
 
@@ -0,0 +1,53 @@
+# 命令行入口，用法：python -m sylfk <命令> [参数]
+import argparse
+
+from sylfk.static import build_manifest, compress_static
+
+from sylfk.template_engine import precompile_templates, save_compiled_templates
+
+
+def cmd_compress(args):
+    """为静态资源生成 .gz 预压缩文件"""
+    count = compress_static(args.folder, min_size=args.min_size, level=args.level)
+    print('compressed {} file(s) in {}'.format(count, args.folder))
+
+
+def cmd_manifest(args):
+    """为静态资源生成带指纹文件名的清单"""
+    manifest = build_manifest(args.folder)
+    print('fingerprinted {} file(s) in {}'.format(len(manifest), args.folder))
+
+
+def cmd_templates(args):
+    """编译全部模板并把编译结果保存到缓存目录"""
+    count = precompile_templates(args.folder)
+    save_compiled_templates(args.cache_dir)
+    print('compiled {} template(s) from {} into {}'.format(count, args.folder, args.cache_dir))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m sylfk')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    compress = commands.add_parser('compress', help=cmd_compress.__doc__)
+    compress.add_argument('folder', nargs='?', default='static', help='静态资源目录')
+    compress.add_argument('--min-size', type=int, default=256, help='小于此字节数的文件不压缩')
+    compress.add_argument('--level', type=int, default=9, help='gzip 压缩级别')
+    compress.set_defaults(func=cmd_compress)
+
+    manifest = commands.add_parser('manifest', help=cmd_manifest.__doc__)
+    manifest.add_argument('folder', nargs='?', default='static', help='静态资源目录')
+    manifest.set_defaults(func=cmd_manifest)
+
+    templates = commands.add_parser('templates', help=cmd_templates.__doc__)
+    templates.add_argument('folder', nargs='?', default='templates', help='模板目录')
+    templates.add_argument('--cache-dir', default='.template_cache', help='编译结果存放目录')
+    templates.set_defaults(func=cmd_templates)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# 数据库异步访问模块
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDB:
+    """
+    BaseDB 的异步接口，查询在有界线程池中执行，返回可等待对象
+    线程数不超过连接池的最大连接数，每个线程执行查询时从连接池借出连接
+    事务与线程绑定，不能跨多次调用使用 transaction，需要事务时在一个函数中完成后交给 run 执行
+    """
+
+    def __init__(self, db, max_workers=None):
+        """
+        :param db: BaseDB 实例
+        :param max_workers: 最大线程数，为空时与连接池的最大连接数相同
+        """
+        self.db = db
+        self.max_workers = min(max_workers or db.pool.max_size, db.pool.max_size)
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='sylfk-db')
+
+    def run(self, func, *args, **options):
+        """
+        在线程池中执行函数，返回可等待对象
+        """
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, functools.partial(func, *args, **options))
+
+    def execute(self, sql, params=None, cache=True):
+        return self.run(self.db.execute, sql, params, cache)
+
+    def insert(self, sql, params=None):
+        return self.run(self.db.insert, sql, params)
+
+    def executemany(self, sql, params_seq, chunk_size=500):
+        return self.run(self.db.executemany, sql, params_seq, chunk_size)
+
+    def bulk_insert(self, table, rows, chunk_size=500):
+        return self.run(self.db.bulk_insert, table, rows, chunk_size)
+
+    def process(self, func, params=None):
+        return self.run(self.db.process, func, params)
+
+    @staticmethod
+    async def gather(*aws):
+        """
+        同时等待多个查询，按传入顺序返回 DBResult 列表，总耗时取决于最慢的查询
+        """
+        return list(await asyncio.gather(*aws))
+
+    def parallel(self, *queries):
+        """
+        同步接口，供普通视图使用，在线程池中同时执行多条查询，全部完成后按顺序返回 DBResult 列表
+        :param queries: SQL 语句，或 (SQL 语句, 参数) 元组
+        """
+        futures = []
+        for query in queries:
+            sql, params = (query, None) if isinstance(query, str) else query
+            futures.append(self.executor.submit(self.db.execute, sql, params))
+        return [future.result() for future in futures]
+
+    def close(self):
+        """等待正在执行的查询完成后关闭线程池"""
+        self.executor.shutdown(wait=True)
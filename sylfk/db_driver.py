@@ -0,0 +1,336 @@
+# 数据库驱动模块
+import functools
+import itertools
+import os
+import re
+import sqlite3
+import threading
+
+import sylfk.exceptions as exceptions
+from sylfk.dbconnector import DBResult
+
+
+class Driver:
+    """
+    数据库驱动基类，BaseDB 通过驱动创建连接和游标，屏蔽不同数据库之间的差异
+    连接和游标的接口与 PyMySQL 一致：游标是上下文对象，execute 返回影响行数
+    """
+
+    def connect(self, db):
+        """
+        创建连接
+        :param db: BaseDB 实例，从中读取主机、用户名、数据库等连接参数
+        """
+        raise NotImplementedError
+
+    def ping(self, conn):
+        """
+        检查连接是否可用，不可用时抛出异常
+        """
+        raise NotImplementedError
+
+    def cursor(self, conn, tuples=False, stream=False):
+        """
+        创建游标
+        :param tuples: 为 True 时每行为元组，否则使用连接的默认行类型
+        :param stream: 为 True 时使用无缓冲游标，逐批读取结果
+        """
+        raise NotImplementedError
+
+    def begin(self, conn, read_only=False):
+        """
+        开始事务
+        :param read_only: 是否为只读事务
+        """
+        raise NotImplementedError
+
+    def first_insert_id(self, cursor, count):
+        """
+        返回多行插入语句插入的第一行的 ID
+        :param count: 插入的行数
+        """
+        raise NotImplementedError
+
+    def create_db(self, db, db_name, db_charset):
+        """创建数据库，返回 DBResult 对象"""
+        raise NotImplementedError
+
+    def drop_db(self, db, db_name):
+        """删除数据库，返回 DBResult 对象"""
+        raise NotImplementedError
+
+    def max_connections(self, db_name):
+        """
+        返回数据库允许的最大连接数，为 None 时不限制，由连接池的设置决定
+        """
+        return None
+
+    def close(self):
+        """释放驱动自身占用的资源，BaseDB 关闭时调用"""
+
+
+class MySQLDriver(Driver):
+    """
+    MySQL 驱动，使用 PyMySQL 连接数据库
+    """
+
+    def __init__(self):
+        # 只有使用 MySQL 时才需要安装 PyMySQL
+        import pymysql
+        import pymysql.cursors
+        self.pymysql = pymysql
+
+    def connect(self, db):
+        cursors = self.pymysql.cursors
+        return self.pymysql.connect(host=db.host, user=db.user, port=db.port,
+                                    password=db.password, db=db.database, charset=db.charset,
+                                    cursorclass=db.cursor_class or cursors.DictCursor)
+
+    def ping(self, conn):
+        conn.ping(reconnect=False)
+
+    def cursor(self, conn, tuples=False, stream=False):
+        cursors = self.pymysql.cursors
+        if stream:
+            # 字典游标对应无缓冲的字典游标，其它游标对应无缓冲的元组游标
+            if not tuples and issubclass(conn.cursorclass, cursors.DictCursorMixin):
+                return conn.cursor(cursors.SSDictCursor)
+            return conn.cursor(cursors.SSCursor)
+        if tuples:
+            return conn.cursor(cursors.Cursor)
+        return conn.cursor()
+
+    def begin(self, conn, read_only=False):
+        with conn.cursor() as cursor:
+            cursor.execute('START TRANSACTION READ ONLY' if read_only else 'START TRANSACTION')
+
+    def first_insert_id(self, cursor, count):
+        # MySQL 中 lastrowid 为多行插入语句插入的第一行的 ID
+        return cursor.lastrowid
+
+    def create_db(self, db, db_name, db_charset):
+        return db.execute('CREATE DATABASE {} CHARSET {}'.format(db_name, db_charset))
+
+    def drop_db(self, db, db_name):
+        return db.execute('DROP DATABASE {}'.format(db_name))
+
+
+# 匹配 PyMySQL 风格的参数占位符
+_placeholder = re.compile(r'%\((\w+)\)s|%s|%%')
+
+
+@functools.lru_cache(maxsize=256)
+def convert_paramstyle(sql):
+    """
+    把 PyMySQL 风格的参数占位符转换为 sqlite3 风格，%(name)s 转为 :name，%s 转为 ?
+    """
+    def replace(match):
+        if match.group(1):
+            return ':' + match.group(1)
+        return '?' if match.group(0) == '%s' else '%'
+    return _placeholder.sub(replace, sql)
+
+
+class SQLiteCursor:
+    """
+    sqlite3 游标的包装，提供与 PyMySQL 游标一致的接口
+    """
+
+    def __init__(self, conn, tuples=False, stream=False):
+        self._conn = conn  # sqlite3 连接对象
+        self._cursor = conn.cursor()
+        self.tuples = tuples  # 每行是否为元组
+        self.stream = stream  # 是否逐批读取结果
+        self._buffer = None  # 非流式查询一次读入的结果
+        self._columns = None  # 字段名列表，用于转换字典行
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _rows(self, rows):
+        # 按需把元组行转换为字典行
+        if self.tuples:
+            return rows
+        columns = self._columns
+        return [dict(zip(columns, row)) for row in rows]
+
+    def execute(self, sql, params=None):
+        if params is None:
+            self._cursor.execute(sql)
+        else:
+            self._cursor.execute(convert_paramstyle(sql), params)
+        description = self._cursor.description
+        if description is None:
+            self._buffer = None
+            return self._cursor.rowcount
+        self._columns = [column[0] for column in description]
+        if self.stream:
+            return 0
+        # 与 PyMySQL 一致，查询语句的影响行数为结果行数
+        self._buffer = self._cursor.fetchall()
+        return len(self._buffer)
+
+    def executemany(self, sql, params_seq):
+        # 不在事务中时显式开启事务，避免每行单独提交
+        if not self._conn.in_transaction:
+            self._cursor.execute('BEGIN')
+        self._cursor.executemany(convert_paramstyle(sql), params_seq)
+        return self._cursor.rowcount
+
+    def callproc(self, func, params=None):
+        raise sqlite3.NotSupportedError('SQLite does not support stored procedures')
+
+    def fetchall(self):
+        if self._buffer is not None:
+            rows, self._buffer = self._buffer, []
+        elif self._cursor.description is not None:
+            rows = self._cursor.fetchall()
+        else:
+            return ()
+        return self._rows(rows)
+
+    def fetchmany(self, size):
+        if self._buffer is not None:
+            rows, self._buffer = self._buffer[:size], self._buffer[size:]
+        else:
+            rows = self._cursor.fetchmany(size)
+        return self._rows(rows)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteDriver(Driver):
+    """
+    SQLite 驱动，使用标准库 sqlite3，不需要数据库服务器
+    每个数据库是 folder 目录下的一个文件，未选择数据库时连接内存数据库
+    内存数据库只允许一个连接，同时借出多个连接的操作（如 iter_query 期间执行其它语句）会等待超时
+    连接处于自动提交模式，事务由 BEGIN 显式开启
+    """
+
+    # 区分不同驱动实例的内存数据库
+    _memory_ids = itertools.count()
+
+    def __init__(self, folder='.', journal_mode='WAL', synchronous='NORMAL',
+                 mmap_size=256 * 1024 * 1024, timeout=30):
+        """
+        :param folder: 数据库文件存放目录
+        :param journal_mode: 日志模式，WAL 模式下读写互不阻塞
+        :param synchronous: 同步模式，WAL 模式下 NORMAL 只在检查点时同步磁盘
+        :param mmap_size: 内存映射读取的最大字节数，为 0 时不使用内存映射
+        :param timeout: 数据库被锁定时的最长等待时间，单位秒
+        """
+        self.folder = folder
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        # 连接池中的连接通过共享缓存使用同一个内存数据库
+        self.memory_uri = 'file:sylfk_mem_{}?mode=memory&cache=shared'.format(
+            next(self._memory_ids))
+        # 内存数据库在最后一个连接关闭时销毁，保留一个连接直到驱动关闭，
+        # 连接池回收或替换连接时数据不会丢失
+        self._memory_keeper = None
+        self._memory_lock = threading.Lock()
+
+    def db_path(self, db_name):
+        """
+        返回数据库文件路径，没有扩展名时加上 .db
+        """
+        if not db_name or db_name == ':memory:':
+            return ':memory:'
+        if not os.path.splitext(db_name)[1]:
+            db_name += '.db'
+        return os.path.join(self.folder, db_name)
+
+    def _open(self, path):
+        if path == ':memory:':
+            with self._memory_lock:
+                if self._memory_keeper is None:
+                    self._memory_keeper = sqlite3.connect(self.memory_uri, uri=True,
+                                                          check_same_thread=False)
+            conn = sqlite3.connect(self.memory_uri, uri=True, timeout=self.timeout,
+                                   isolation_level=None, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+        if path != ':memory:':
+            conn.execute('PRAGMA journal_mode = {}'.format(self.journal_mode))
+            conn.execute('PRAGMA mmap_size = {}'.format(int(self.mmap_size)))
+        conn.execute('PRAGMA synchronous = {}'.format(self.synchronous))
+        return conn
+
+    def connect(self, db):
+        path = self.db_path(db.database)
+        # 与 MySQL 一致，选择的数据库不存在时抛出异常，而不是创建新文件
+        if path != ':memory:' and not os.path.exists(path):
+            raise exceptions.UnknownDatabaseError(1049, "Unknown database '{}'".format(db.database))
+        return self._open(path)
+
+    def ping(self, conn):
+        # 本地文件没有网络连接，无需检查
+        pass
+
+    def max_connections(self, db_name):
+        # 共享缓存的内存数据库使用表级锁，多个连接同时写入会直接报错而不是等待
+        if self.db_path(db_name) == ':memory:':
+            return 1
+        return None
+
+    def close(self):
+        # 关闭保留的连接，内存数据库随之销毁
+        with self._memory_lock:
+            keeper, self._memory_keeper = self._memory_keeper, None
+        if keeper is not None:
+            keeper.close()
+
+    def cursor(self, conn, tuples=False, stream=False):
+        return SQLiteCursor(conn, tuples=tuples, stream=stream)
+
+    def begin(self, conn, read_only=False):
+        # SQLite 没有只读事务，开启普通的延迟事务，第一次读取时获得快照
+        conn.execute('BEGIN')
+
+    def first_insert_id(self, cursor, count):
+        # SQLite 中 lastrowid 为最后插入的一行的 ID，多行插入语句的 ID 是连续的
+        return cursor.lastrowid - count + 1 if cursor.lastrowid else None
+
+    @DBResult.handler
+    def create_db(self, db, db_name, db_charset):
+        path = self.db_path(db_name)
+        if os.path.exists(path):
+            raise exceptions.DatabaseExistsError(
+                1007, "Can't create database '{}'; database exists".format(db_name))
+        os.makedirs(self.folder, exist_ok=True)
+        # 创建数据库文件，WAL 模式记录在文件中
+        self._open(path).close()
+        return 1, None
+
+    @DBResult.handler
+    def drop_db(self, db, db_name):
+        path = self.db_path(db_name)
+        if not os.path.exists(path):
+            raise exceptions.UnknownDatabaseError(
+                1008, "Can't drop database '{}'; database doesn't exist".format(db_name))
+        # 删除正在使用的数据库时，先关闭连接池中的连接
+        if self.db_path(db.database) == path:
+            db.pool.reset()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        if db.query_cache is not None:
+            db.query_cache.clear()
+        return 0, None
@@ -1,15 +1,104 @@
-import pymysql
-import pymysql.cursors
+import functools
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+
+import sylfk.exceptions as exceptions
+
+
+class Row(Mapping):
+    """
+    紧凑结果集中一行数据的只读视图，可以像字典一样通过 row['f_name'] 取值
+    字段名与下标的映射由整个结果集共享，每行只保存一个元组
+    """
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index  # 字段名与下标的映射
+        self._values = values  # 这一行的值
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            # 也支持按下标取值，下标越界时按 Mapping 的约定抛出 KeyError
+            if isinstance(key, int):
+                try:
+                    return self._values[key]
+                except IndexError:
+                    raise KeyError(key) from None
+            raise
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return 'Row({!r})'.format(dict(self))
+
+
+class ResultSet(Sequence):
+    """
+    紧凑结果集，字段名元组由所有行共享，每行数据存为元组，取出时包装为 Row 视图
+    相比每行一个字典，省去了每行重复的字段名和字典的哈希表开销
+    """
+
+    __slots__ = ('columns', 'data', '_index')
+
+    def __init__(self, columns, data):
+        self.columns = tuple(columns)  # 字段名元组
+        self.data = data  # 各行数据的元组组成的序列
+        self._index = {name: i for i, name in enumerate(self.columns)}
+
+    @classmethod
+    def from_cursor(cls, cursor):
+        """由执行过查询的元组游标创建结果集"""
+        return cls([column[0] for column in cursor.description], cursor.fetchall())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Row(self._index, values) for values in self.data[index]]
+        return Row(self._index, self.data[index])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        index = self._index
+        return (Row(index, values) for values in self.data)
+
+    def __repr__(self):
+        return 'ResultSet(columns={!r}, rows={})'.format(self.columns, len(self.data))
+
+    def column(self, name):
+        """返回一列数据组成的列表"""
+        i = self._index[name]
+        return [values[i] for values in self.data]
+
+    def to_dicts(self):
+        """转换为字典组成的列表，用于序列化为 JSON"""
+        return [dict(zip(self.columns, values)) for values in self.data]
 
 
 class DBResult:
     """操作数据库后的返回结果类
     该类的实例为返回结果生成的对象，包括执行成功与否、异常信息、影响行数等信息
     """
-    success = False  # 执行成功与否
-    result = None  # 执行结果，通常是查询结果集，一个列表嵌套字典的结构
-    error_info = None  # 异常信息
-    rows = None  # 影响行数
+
+    __slots__ = ('success', 'result', 'error_info', 'rows')
+
+    def __init__(self):
+        self.success = False  # 执行成功与否
+        self.result = None  # 执行结果，通常是查询结果集，一个列表嵌套字典的结构，紧凑模式下为 ResultSet
+        self.error_info = None  # 异常信息
+        self.rows = None  # 影响行数
 
     def index_of(self, index):
         """返回结果集合中指定索引的一条数据
@@ -45,14 +134,468 @@ class DBResult:
 
     def to_dict(self):
         """返回四个基本属性构成的字典对象"""
+        result = self.result
+        if isinstance(result, ResultSet):
+            result = result.to_dicts()
         return {
             'success': self.success,
-            'result': self.result,
+            'result': result,
             'error_info': str(self.error_info),
             'rows': self.rows
         }
 
 
+class PooledConnection:
+    """连接池中的连接及其状态"""
+
+    __slots__ = ('conn', 'created', 'last_used', 'generation')
+
+    def __init__(self, conn, generation):
+        self.conn = conn  # 数据库连接对象
+        self.created = time.monotonic()  # 创建时间
+        self.last_used = self.created  # 最后一次归还的时间
+        self.generation = generation  # 创建时连接池的代数，代数变化后旧连接作废
+
+
+class ConnectionPool:
+    """
+    线程安全的数据库连接池
+    借出时检查连接的存活时间和可用性，失效的连接自动替换为新连接
+    """
+
+    def __init__(self, creator, min_size=1, max_size=10, timeout=30,
+                 max_lifetime=3600, ping_interval=1.0, ping=None):
+        """
+        :param creator: 创建新连接的函数
+        :param min_size: 初始化时预先创建的连接数
+        :param max_size: 最大连接数
+        :param timeout: 没有空闲连接时的最长等待时间，单位秒
+        :param max_lifetime: 连接的最长存活时间，超过后关闭重建，单位秒
+        :param ping_interval: 连接空闲超过此秒数时，借出前先 ping 检查是否可用
+        :param ping: 检查连接是否可用的函数，不可用时抛出异常，为空时调用连接的 ping 方法
+        """
+        self.creator = creator
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.ping = ping or (lambda conn: conn.ping(reconnect=False))
+        self._idle = deque()  # 空闲连接，后进先出，常用的连接保持活跃
+        self._size = 0  # 已创建的连接总数，包括借出的连接
+        self._generation = 0  # 连接池代数，reset 时加一
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append(self._create())
+            self._size += 1
+
+    def _create(self):
+        return PooledConnection(self.creator(), self._generation)
+
+    @staticmethod
+    def _close_conn(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        """
+        借出一个连接，超时抛出 PoolTimeoutError
+        :param timeout: 最长等待时间，为空时使用连接池的设置
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise exceptions.PoolClosedError
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # 先占用名额，在锁外创建连接
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise exceptions.PoolTimeoutError
+                self._cond.wait(remaining)
+
+        try:
+            if entry is None:
+                return self._create()
+            return self._check(entry)
+        except Exception:
+            # 创建连接失败时归还名额
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _check(self, entry):
+        # 连接已作废或超过存活时间时重建，空闲较久的连接先 ping 一次
+        now = time.monotonic()
+        if entry.generation != self._generation or now - entry.created > self.max_lifetime:
+            self._close_conn(entry.conn)
+            return self._create()
+        if now - entry.last_used >= self.ping_interval:
+            try:
+                self.ping(entry.conn)
+            except Exception:
+                # 连接已断开，自动重连
+                self._close_conn(entry.conn)
+                return self._create()
+        return entry
+
+    def release(self, entry, discard=False):
+        """
+        归还连接
+        :param entry: acquire 返回的连接
+        :param discard: 是否丢弃此连接，连接出现异常时使用
+        """
+        entry.last_used = time.monotonic()
+        with self._cond:
+            keep = not (discard or self._closed or entry.generation != self._generation)
+            if keep:
+                self._idle.append(entry)
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not keep:
+            self._close_conn(entry.conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        借出连接的上下文对象，退出时自动归还
+        发生异常时回滚未提交的修改，回滚失败说明连接不可用，直接丢弃
+        """
+        entry = self.acquire(timeout)
+        try:
+            yield entry.conn
+        except BaseException:
+            try:
+                entry.conn.rollback()
+                broken = False
+            except Exception:
+                broken = True
+            self.release(entry, discard=broken)
+            raise
+        self.release(entry)
+
+    def reset(self):
+        """
+        作废全部现有连接，空闲连接立即关闭，借出的连接归还时关闭
+        """
+        with self._cond:
+            self._generation += 1
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for entry in idle:
+            self._close_conn(entry.conn)
+
+    def close(self):
+        """
+        关闭连接池，借出的连接归还时关闭
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_conn(entry.conn)
+
+    def stats(self):
+        """返回连接池的统计信息"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+
+# 匹配 SQL 语句中的字符串常量和连续的空白字符，规范化时只压缩字符串外的空白
+_sql_space = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|\s+""")
+# 匹配 SQL 语句中表名所在的位置
+_sql_table = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+`?(\w+)`?(?:\.`?(\w+)`?)?', re.I)
+# 结果不确定的查询不缓存
+_sql_volatile = re.compile(r'\b(?:FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE|RAND|NOW|UUID|'
+                           r'CURRENT_TIMESTAMP|CURDATE|CURTIME|SYSDATE|LAST_INSERT_ID)\b', re.I)
+# 会修改表结构或影响范围无法判断的语句，执行后清空全部缓存
+_sql_ddl = re.compile(r'^\s*(?:CREATE|DROP|ALTER|TRUNCATE|RENAME|USE|LOAD|CALL)\b', re.I)
+# 匹配字符串常量，解析表名前替换为空字符串
+_sql_string = re.compile(r"'(?:[^'\\]|\\.)*'" r'|"(?:[^"\\]|\\.)*"')
+# 表列表的开头，FROM 和 UPDATE 之后可以是逗号分隔的多个表
+_sql_table_list = re.compile(r'\b(?:FROM|UPDATE)\b', re.I)
+# 表列表的结尾
+_sql_table_list_end = re.compile(r'\b(?:WHERE|SET|GROUP|ORDER|HAVING|LIMIT|UNION|FOR|LOCK|WINDOW|'
+                                 r'INTO|PROCEDURE|VALUES|SELECT)\b|;', re.I)
+# 表列表中表与表之间的分隔
+_sql_table_sep = re.compile(r',|\b(?:NATURAL\s+)?(?:(?:LEFT|RIGHT|FULL)\s+(?:OUTER\s+)?|INNER\s+|'
+                            r'CROSS\s+)?JOIN\b|\bSTRAIGHT_JOIN\b', re.I)
+# 连接条件
+_sql_join_condition = re.compile(r'\b(?:ON|USING)\b', re.I)
+# 表列表中的一项：表名或库名.表名，后面可以有别名
+_sql_table_ref = re.compile(r'`?(\w+)`?(?:\.`?(\w+)`?)?(?:\s+(?:AS\s+)?`?\w+`?)?', re.I)
+
+
+# 合法的表名和字段名，只允许字母、数字和下划线
+_sql_identifier = re.compile(r'\w+')
+
+
+def quote_identifier(name):
+    """
+    给表名或字段名加上反引号，名称不合法时抛出 InvalidIdentifierError
+    表名和字段名无法使用参数占位符，必须检查后才能拼接到 SQL 语句中
+    """
+    if not isinstance(name, str) or not _sql_identifier.fullmatch(name):
+        raise exceptions.InvalidIdentifierError(message='Invalid SQL identifier: {!r}'.format(name))
+    return '`{}`'.format(name)
+
+
+def normalize_sql(sql):
+    """
+    规范化 SQL 语句，压缩字符串常量以外的空白字符，去掉首尾空白和结尾的分号
+    """
+    sql = _sql_space.sub(lambda m: m.group(1) or ' ', sql)
+    return sql.strip().rstrip(';').rstrip()
+
+
+def _mask_parens(sql):
+    # 把括号内的字符替换为空格，只保留最外层的括号，便于在最外层查找关键字和分隔符
+    # 返回替换后的字符串，括号不匹配时返回 None
+    chars = list(sql)
+    depth = 0
+    for i, char in enumerate(sql):
+        if char == '(':
+            if depth:
+                chars[i] = ' '
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth:
+                chars[i] = ' '
+        elif depth:
+            chars[i] = ' '
+    return ''.join(chars) if depth == 0 else None
+
+
+def _table_list(sql, start):
+    # 返回从 start 开始的表列表的原文，到最外层的结尾关键字或所在子查询的右括号为止
+    depth = 0
+    for i in range(start, len(sql)):
+        char = sql[i]
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                return sql[start:i]
+            depth -= 1
+        elif depth == 0 and _sql_table_list_end.match(sql, i):
+            return sql[start:i]
+    return sql[start:]
+
+
+@functools.lru_cache(maxsize=1024)
+def sql_tables(sql):
+    """
+    返回 SQL 语句涉及的表名集合，表名统一为小写，带库名时只取表名
+    FROM 和 UPDATE 之后逗号分隔或 JOIN 连接的表都会被解析，子查询中的表也包括在内，
+    存在无法解析的表列表时返回 None，调用方不能据此判断语句影响的表
+    """
+    sql = _sql_string.sub("''", sql)
+    tables = {(m.group(2) or m.group(1)).lower() for m in _sql_table.finditer(sql)}
+
+    for match in _sql_table_list.finditer(sql):
+        text = _table_list(sql, match.end())
+        masked = _mask_parens(text)
+        if masked is None:
+            return None
+        # 按最外层的逗号和 JOIN 拆分为单个表
+        bounds = [0]
+        for sep in _sql_table_sep.finditer(masked):
+            bounds.extend((sep.start(), sep.end()))
+        bounds.append(len(masked))
+        for begin, end in zip(bounds[::2], bounds[1::2]):
+            # 去掉连接条件
+            condition = _sql_join_condition.search(masked, begin, end)
+            if condition is not None:
+                end = condition.start()
+            ref, masked_ref = text[begin:end].strip(), masked[begin:end].strip()
+            if not ref:
+                return None
+            if ref.startswith('('):
+                # 子查询中的表由其自身的 FROM 解析，括号中的多表连接无法解析
+                close = masked_ref.find(')')
+                if re.match(r'\s*SELECT\b', ref[1:close], re.I) and \
+                        re.fullmatch(r'\s*(?:(?:AS\s+)?`?\w+`?)?', masked_ref[close + 1:], re.I):
+                    continue
+                return None
+            table = _sql_table_ref.fullmatch(ref)
+            if table is None:
+                return None
+            tables.add((table.group(2) or table.group(1)).lower())
+    return frozenset(tables)
+
+
+class QueryCache:
+    """
+    查询结果缓存，按规范化的 SQL 语句和参数存放 SELECT 语句的执行结果
+    条目超过有效期后失效，条目数超出上限时淘汰最久未使用的条目
+    写入某个表后，读取过这个表的条目全部失效
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries  # 条目数上限
+        self.ttl = ttl  # 有效期，单位秒
+        self.hits = 0  # 命中次数
+        self.misses = 0  # 未命中次数
+        self.invalidations = 0  # 因写入而失效的条目数
+        self._entries = OrderedDict()  # 键与 (影响行数, 结果, 涉及的表, 过期时间) 的映射
+        self._tables = {}  # 表名与读取此表的缓存键集合的映射
+        self._versions = {}  # 表名与写入次数的映射，用于丢弃查询期间表被写入的结果
+        self._epoch = 0  # 清空次数
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(sql, params):
+        """
+        由 SQL 语句和参数生成缓存键，不可缓存的语句返回 None
+        :param sql: SQL 语句
+        :param params: SQL 语句的参数
+        """
+        sql = normalize_sql(sql)
+        if sql[:6].upper() != 'SELECT' or _sql_volatile.search(sql):
+            return None
+        # 读取的表不能完整解析时无法在写入后失效，不缓存
+        if sql_tables(sql) is None:
+            return None
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        elif isinstance(params, list):
+            params = tuple(params)
+        key = (sql, params)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def snapshot(self, tables):
+        """
+        记录查询开始时各个表的写入次数，存放结果时用来判断期间是否有写入
+        """
+        with self._lock:
+            return self._epoch, tuple(self._versions.get(table, 0) for table in tables)
+
+    def get(self, key):
+        """
+        获取缓存的 (影响行数, 结果)，不存在或已过期时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[3] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], entry[1]
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, tables, snapshot, rows, result):
+        """
+        存放查询结果，查询期间涉及的表被写入过时不存放
+        :param key: 缓存键
+        :param tables: 查询涉及的表名集合
+        :param snapshot: 查询开始前 snapshot 方法的返回值
+        :param rows: 影响行数
+        :param result: 查询结果
+        """
+        with self._lock:
+            epoch, versions = snapshot
+            if epoch != self._epoch or \
+                    versions != tuple(self._versions.get(table, 0) for table in tables):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, result, tables, time.monotonic() + self.ttl)
+            for table in tables:
+                self._tables.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        # 删除条目，同时从表名索引中移除
+        _, _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+    def invalidate(self, tables):
+        """
+        使读取过这些表的条目全部失效
+        :param tables: 被写入的表名集合
+        """
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                for key in list(self._tables.get(table, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def invalidate_sql(self, sql):
+        """
+        根据执行的写入语句使相关条目失效，无法判断影响范围的语句清空全部缓存
+        """
+        tables = sql_tables(sql)
+        if not tables or _sql_ddl.match(sql):
+            self.clear()
+        else:
+            self.invalidate(tables)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tables.clear()
+            self._epoch += 1
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+class TransactionState:
+    """当前线程正在进行的事务"""
+
+    __slots__ = ('entry', 'depth', 'pending')
+
+    def __init__(self, entry):
+        self.entry = entry  # 事务占用的连接
+        self.depth = 0  # 嵌套层数，大于 0 时内层使用保存点
+        self.pending = []  # 提交后才使查询缓存失效的语句
+
+
 class BaseDB:
     """数据库客户端类，该类的实力即为连接数据库的对象"""
 
@@ -64,7 +607,13 @@ class BaseDB:
             host='127.0.0.1',
             port=3306,
             charset='utf8',
-            cursor_class=pymysql.cursors.DictCursor
+            cursor_class=None,
+            pool_min_size=1,
+            pool_max_size=10,
+            pool_timeout=30,
+            pool_max_lifetime=3600,
+            compact=False,
+            driver=None
     ):
         self.user = user  # 用户名
         self.password = password  # 密码
@@ -72,26 +621,163 @@ class BaseDB:
         self.host = host  # 主机名，默认 127.0.0.1
         self.port = port  # 端口号，默认 3306
         self.charset = charset  # 数据库编码，默认 UTF-8
-        self.cursor_class = cursor_class  # 数据库游标类型，默认 DictCursor
-        self.conn = self.connect()  # 数据库连接对象
+        self.cursor_class = cursor_class  # 数据库游标类型，为空时使用 DictCursor
+        # 数据库驱动，默认使用 MySQL
+        if driver is None:
+            from sylfk.db_driver import MySQLDriver
+            driver = MySQLDriver()
+        self.driver = driver
+        # 数据库连接池，每次操作从中借出连接，操作完成后归还
+        self.pool_max_size = pool_max_size  # 连接池的最大连接数，驱动可以对某些数据库进一步限制
+        self.pool = ConnectionPool(self.connect, min_size=pool_min_size,
+                                   max_size=self._pool_limit(), timeout=pool_timeout,
+                                   max_lifetime=pool_max_lifetime, ping=driver.ping)
+        self.query_cache = None  # 查询结果缓存，默认关闭
+        # 紧凑结果模式，execute 的查询结果为 ResultSet，每行为共享字段名的元组，节省内存
+        self.compact = compact
+        self._local = threading.local()  # 保存各个线程正在进行的事务
+
+    def enable_query_cache(self, max_entries=1024, ttl=60):
+        """
+        开启查询结果缓存，execute 执行的 SELECT 语句结果按 SQL 语句和参数缓存
+        通过本对象执行的写入语句会使相关的缓存失效，其它客户端的写入只能等待缓存过期，
+        缓存的结果由多次调用共享，不要修改
+        :param max_entries: 最多缓存的查询数
+        :param ttl: 有效期，单位秒
+        """
+        self.query_cache = QueryCache(max_entries, ttl)
+        return self.query_cache
+
+    def disable_query_cache(self):
+        """关闭查询结果缓存"""
+        self.query_cache = None
+
+    def _invalidate(self, sql, clear=False):
+        # 写入后使相关的查询缓存失效，事务中的写入在提交后才失效
+        tx = getattr(self._local, 'tx', None)
+        if tx is not None:
+            tx.pending.append((sql, clear))
+        elif self.query_cache is not None:
+            if clear:
+                self.query_cache.clear()
+            else:
+                self.query_cache.invalidate_sql(sql)
+
+    def in_transaction(self):
+        """当前线程是否在事务中"""
+        return getattr(self._local, 'tx', None) is not None
+
+    @contextmanager
+    def _connection(self):
+        # 事务中使用事务占用的连接，否则从连接池借出
+        tx = getattr(self._local, 'tx', None)
+        if tx is not None:
+            yield tx.entry.conn
+        else:
+            with self.pool.connection() as conn:
+                yield conn
+
+    def _commit(self, conn):
+        # 事务中的语句不单独提交，由事务统一提交
+        if getattr(self._local, 'tx', None) is None:
+            conn.commit()
+
+    @contextmanager
+    def transaction(self, read_only=False):
+        """
+        事务上下文对象，其中执行的语句使用同一个连接，退出时统一提交一次，发生异常时回滚
+        嵌套使用时内层使用保存点，内层发生异常只回滚到保存点
+        语句执行失败不会抛出异常，只返回失败的 DBResult，需要回滚时由调用方抛出异常
+        iter_query 不使用事务的连接，看不到事务中未提交的修改
+        :param read_only: 以只读事务执行，适合只读视图，多条查询读取同一个快照且不逐条提交
+        """
+        tx = getattr(self._local, 'tx', None)
+        if tx is not None:
+            # 嵌套事务，使用保存点
+            tx.depth += 1
+            savepoint = 'sylfk_sp_{}'.format(tx.depth)
+            conn = tx.entry.conn
+            with self.driver.cursor(conn) as cursor:
+                cursor.execute('SAVEPOINT ' + savepoint)
+            try:
+                yield conn
+            except BaseException:
+                with self.driver.cursor(conn) as cursor:
+                    cursor.execute('ROLLBACK TO SAVEPOINT ' + savepoint)
+                raise
+            else:
+                with self.driver.cursor(conn) as cursor:
+                    cursor.execute('RELEASE SAVEPOINT ' + savepoint)
+            finally:
+                tx.depth -= 1
+            return
+
+        entry = self.pool.acquire()
+        conn = entry.conn
+        tx = TransactionState(entry)
+        try:
+            self.driver.begin(conn, read_only)
+        except BaseException:
+            self.pool.release(entry, discard=True)
+            raise
+        self._local.tx = tx
+        try:
+            yield conn
+            self._local.tx = None
+            conn.commit()
+        except BaseException:
+            self._local.tx = None
+            # 回滚失败说明连接不可用，直接丢弃
+            try:
+                conn.rollback()
+                broken = False
+            except Exception:
+                broken = True
+            self.pool.release(entry, discard=broken)
+            raise
+        self.pool.release(entry)
+        # 提交后使事务中写入的表的查询缓存失效
+        for sql, clear in tx.pending:
+            self._invalidate(sql, clear)
+
+    def _pool_limit(self):
+        # 当前数据库允许的最大连接数
+        limit = self.driver.max_connections(self.database)
+        return self.pool_max_size if limit is None else min(self.pool_max_size, limit)
 
     # 建立连接
     def connect(self):
-        return pymysql.connect(host=self.host, user=self.user, port=self.port,
-                               password=self.password, db=self.database,
-                               charset=self.charset, cursorclass=self.cursor_class)
+        return self.driver.connect(self)
 
     # 断开连接
     def close(self):
-        self.conn.close()
+        self.pool.close()
+        self.driver.close()
 
     # 次装饰器利用被装饰的函数的返回值创建一个 DBResult 类的实例并返回
     # execute 方法的返回值是 DBResult 类的实例
     @DBResult.handler
-    def execute(self, sql, params=None):
-        """执行 SQL 语句并返回 DBResult 类的实例"""
-        # 获取数据库连接对象的游标，这是一个上下文对象
-        with self.conn.cursor() as cursor:
+    def execute(self, sql, params=None, cache=True):
+        """
+        执行 SQL 语句并返回 DBResult 类的实例
+        开启查询缓存时，SELECT 语句优先从缓存读取，其它语句执行后使相关缓存失效
+        :param cache: 为 False 时本次查询不读写缓存
+        """
+        query_cache = self.query_cache
+        key = None
+        # 事务中的查询需要读到事务自己的修改，不读写缓存
+        if query_cache is not None and not self.in_transaction():
+            key = query_cache.make_key(sql, params) if cache else None
+            if key is not None:
+                cached = query_cache.get(key)
+                if cached is not None:
+                    return cached
+                tables = sql_tables(sql)
+                snapshot = query_cache.snapshot(tables)
+
+        # 从连接池借出连接，获取数据库连接对象的游标，这是一个上下文对象
+        # 紧凑模式使用元组游标，查询结果包装为 ResultSet
+        with self._connection() as conn, self.driver.cursor(conn, tuples=self.compact) as cursor:
             # 如果参数是字典类型，将其和 SQL 语句一起传入 execute 方法
             # 反之只使用 SQL 语句调用 execute 方法
             # 执行结果为涉及的数据的行数，将其赋值给变量 rows
@@ -100,47 +786,178 @@ class BaseDB:
             else:
                 rows = cursor.execute(sql)
             # 获取执行结果
-            result = cursor.fetchall()
-            self.conn.commit()
+            if self.compact and cursor.description is not None:
+                result = ResultSet.from_cursor(cursor)
+            else:
+                result = cursor.fetchall()
+            self._commit(conn)
+
+        if key is not None:
+            query_cache.put(key, tables, snapshot, rows, result)
+        elif query_cache is not None and normalize_sql(sql)[:6].upper() != 'SELECT':
+            self._invalidate(sql)
         # 返回影响条目数量和执行结果
         return rows, result
 
     # 插入数据并获取最新插入的数据标识，也就是主键索引 ID 字段
+    @DBResult.handler
     def insert(self, sql, params=None):
-        # 获取 SQL 语句执行之后的 DBResult 对象
-        ret = self.execute(sql, params)
-        # 为 DBResult 对象的 result 属性重新赋值为插入数据的 ID
-        ret.result = self.conn.insert_id()
-        # 返回 DBResult 对象
-        return ret
+        # 插入 ID 与连接相关，需要在同一个连接上执行并读取
+        with self._connection() as conn, self.driver.cursor(conn) as cursor:
+            if isinstance(params, dict):
+                rows = cursor.execute(sql, params)
+            else:
+                rows = cursor.execute(sql)
+            self._commit(conn)
+            insert_id = cursor.lastrowid
+        self._invalidate(sql)
+        # DBResult 对象的 result 属性为插入数据的 ID
+        return rows, insert_id
+
+    # 批量执行
+    @DBResult.handler
+    def executemany(self, sql, params_seq, chunk_size=500):
+        """
+        使用多组参数批量执行同一条 SQL 语句，每 chunk_size 组参数在一个事务中执行
+        INSERT ... VALUES 语句由 PyMySQL 合并为多行插入语句，减少网络往返
+        某一批出错时回滚该批，之前的批次已经提交
+        :param sql: SQL 语句
+        :param params_seq: 参数字典的迭代器
+        :param chunk_size: 每批的参数组数
+        """
+        params_seq = iter(params_seq)
+        total = 0
+        with self._connection() as conn, self.driver.cursor(conn) as cursor:
+            while True:
+                chunk = list(itertools.islice(params_seq, chunk_size))
+                if not chunk:
+                    break
+                total += cursor.executemany(sql, chunk)
+                self._commit(conn)
+                self._invalidate(sql)
+        return total, None
+
+    # 批量插入数据并获取插入数据的 ID 范围
+    @DBResult.handler
+    def bulk_insert(self, table, rows, chunk_size=500):
+        """
+        批量插入数据，每 chunk_size 行合并为一条多行 INSERT 语句，在一个事务中执行
+        执行结果为每批插入的 ID 范围 [(第一个 ID, 最后一个 ID), ...]，相邻的范围会合并，
+        多行插入语句生成的自增 ID 是连续的，所以通常只有一个范围
+        某一批出错时回滚该批，之前的批次已经提交
+        :param table: 表名
+        :param rows: 数据字典的迭代器，每个字典的键为字段名，所有字典的键相同，
+            表名和字段名只能包含字母、数字和下划线
+        :param chunk_size: 每批的行数
+        """
+        rows = iter(rows)
+        total = 0
+        id_ranges = []
+        with self._connection() as conn, self.driver.cursor(conn) as cursor:
+            columns = None
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                # 字段名取第一行的键，之后每行按同样的顺序取值
+                if columns is None:
+                    columns = list(chunk[0])
+                    head = 'INSERT INTO {} ({}) VALUES '.format(
+                        quote_identifier(table),
+                        ', '.join(quote_identifier(column) for column in columns))
+                    placeholder = '({})'.format(', '.join(['%s'] * len(columns)))
+                sql = head + ', '.join([placeholder] * len(chunk))
+                count = cursor.execute(sql, [row[column] for row in chunk for column in columns])
+                self._commit(conn)
+                self._invalidate(head)
+                total += count
+
+                # 这条语句插入的第一行的 ID
+                first = self.driver.first_insert_id(cursor, count)
+                if first:
+                    last = first + count - 1
+                    if id_ranges and id_ranges[-1][1] + 1 == first:
+                        id_ranges[-1] = (id_ranges[-1][0], last)
+                    else:
+                        id_ranges.append((first, last))
+        return total, id_ranges
+
+    # 流式查询
+    def iter_query(self, sql, params=None, batch_size=1000, batches=False):
+        """
+        使用无缓冲的服务端游标执行查询，逐行或逐批返回结果的生成器
+        结果不会一次性读入内存，适合导出大表，可以直接传给 stream_csv 和 stream_json
+        查询出错时在迭代过程中抛出异常，不返回 DBResult 对象
+        :param sql: SQL 语句
+        :param params: SQL 语句的参数
+        :param batch_size: 每次从服务端读取的行数
+        :param batches: 为 True 时每次返回一批数据组成的列表，否则每次返回一行
+        """
+        # 迭代期间一直占用同一个连接
+        entry = self.pool.acquire()
+        finished = False
+        try:
+            cursor = self.driver.cursor(entry.conn, stream=True)
+            if isinstance(params, dict):
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if batches:
+                    yield rows
+                else:
+                    yield from rows
+            cursor.close()
+            # 结束查询开启的事务，避免归还的连接停留在旧的快照上并持有元数据锁
+            entry.conn.rollback()
+            finished = True
+        finally:
+            # 没有读完就中断时连接上还有未读取的结果，读完剩余数据代价太大，直接丢弃连接
+            self.pool.release(entry, discard=not finished)
 
     # 存储过程调用
     @DBResult.handler
     def process(self, func, params=None):
-        with self.conn.cursor() as cursor:
+        with self._connection() as conn, self.driver.cursor(conn) as cursor:
             if isinstance(params, dict):
                 rows = cursor.callproc(func, params)
             else:
                 rows = cursor.callproc(func)
             result = cursor.fetchall()
-            self.conn.commit()
+            self._commit(conn)
+        # 存储过程读写哪些表无法判断，清空全部查询缓存
+        self._invalidate(func, clear=True)
         return rows, result
 
     # 创建数据库
     def create_db(self, db_name, db_charset='utf8'):
-        sql = 'CREATE DATABASE {} CHARSET {}'.format(db_name, db_charset)
-        return self.execute(sql)
+        return self.driver.create_db(self, db_name, db_charset)
 
     # 删除数据库
     def drop_db(self, db_name):
-        sql = 'DROP DATABASE {}'.format(db_name)
-        return self.execute(sql)
+        return self.driver.drop_db(self, db_name)
 
     # 选择数据库
     @DBResult.handler
     def choose_db(self, db_name):
-        # 调用 PyMySQL 的 select_db 方法选择数据库
-        self.conn.select_db(db_name)
+        # 作废连接池中的现有连接，之后创建的连接都使用新的数据库
+        old, self.database = self.database, db_name
+        self.pool.max_size = self._pool_limit()
+        self.pool.reset()
+        # 借出一个连接，确认数据库可用，不可用时恢复原来的数据库
+        try:
+            with self.pool.connection():
+                pass
+        except Exception:
+            self.database = old
+            self.pool.max_size = self._pool_limit()
+            self.pool.reset()
+            raise
+        finally:
+            self._invalidate(db_name, clear=True)
         # 没有影响, 返回空值
         return None, None
 
@@ -1,4 +1,4 @@
-from flask import Response
+from werkzeug.wrappers import Response
 
 
 class HahaException(Exception):
@@ -62,6 +62,42 @@ class UnknownFuncError(HahaException):
         super(UnknownFuncError, self).__init__(code, message)
 
 
+class SessionTooLargeError(HahaException):
+    """会话数据超出 Cookie 大小限制"""
+    def __init__(self, code='500', message='Session cookie too large'):
+        super(SessionTooLargeError, self).__init__(code, message)
+
+
+class PoolTimeoutError(HahaException):
+    """等待数据库连接池中的空闲连接超时"""
+    def __init__(self, code='', message='Timed out waiting for a database connection'):
+        super(PoolTimeoutError, self).__init__(code, message)
+
+
+class PoolClosedError(HahaException):
+    """数据库连接池已关闭"""
+    def __init__(self, code='', message='Connection pool is closed'):
+        super(PoolClosedError, self).__init__(code, message)
+
+
+class UnknownDatabaseError(HahaException):
+    """数据库不存在，异常编号与 MySQL 相同"""
+    def __init__(self, code=1049, message='Unknown database'):
+        super(UnknownDatabaseError, self).__init__(code, message)
+
+
+class DatabaseExistsError(HahaException):
+    """数据库已存在，异常编号与 MySQL 相同"""
+    def __init__(self, code=1007, message='Database exists'):
+        super(DatabaseExistsError, self).__init__(code, message)
+
+
+class InvalidIdentifierError(HahaException):
+    """表名或字段名不合法"""
+    def __init__(self, code='', message='Invalid SQL identifier'):
+        super(InvalidIdentifierError, self).__init__(code, message)
+
+
 def capture(ERROR_MAP):
     """捕获异常的装饰器"""
 
@@ -80,8 +116,13 @@ def capture(ERROR_MAP):
                     status = int(e.code) if int(e.code) >= 100 else 500
                     # 判断结果是否为一个响应体
                     # 如果不是就是一个自定义异常处理函数，调用它并封装为响应体返回
-                    if isinstance(rep, Response) or rep is None:
+                    if rep is None:
                         return rep
+                    if isinstance(rep, Response):
+                        # ERROR_MAP 中的响应体被所有请求共享，返回副本，
+                        # 之后设置 Cookie 等报头时不会修改共享的响应体
+                        return Response(rep.get_data(), status=rep.status,
+                                        headers=list(rep.headers.items()))
                     data, content_type, status = rep()
                     return Response(data, content_type=content_type, status=status)
                 # 接着抛出没有对应处理的异常
@@ -1,3 +1,6 @@
+import sylfk.exceptions as exceptions
+
+
 class Route:
     """
     路由装饰器，该类的实例即为路由装饰器
@@ -17,3 +20,173 @@ class Route:
             return f
 
         return decorator
+
+
+class BaseConverter:
+    """
+    路径参数转换器基类，to_python 转换失败时抛出 ValueError 表示不匹配
+    """
+
+    weight = 100  # 匹配优先级，数值越小越先尝试
+
+    def to_python(self, value):
+        if not value:
+            raise ValueError(value)
+        return value
+
+
+class StringConverter(BaseConverter):
+    """字符串参数，匹配一个不含 / 的非空路径段"""
+    weight = 50
+
+
+class IntegerConverter(BaseConverter):
+    """整数参数，匹配一个只由数字组成的路径段"""
+    weight = 10
+
+    def to_python(self, value):
+        if not value.isdigit():
+            raise ValueError(value)
+        return int(value)
+
+
+class PathConverter(BaseConverter):
+    """路径参数，匹配剩余的全部路径（可包含 /），只能位于规则末尾"""
+    weight = 200
+
+
+# 转换器名称及其类的映射关系
+CONVERTER_MAP = {
+    'str': StringConverter,
+    'int': IntegerConverter,
+    'path': PathConverter,
+}
+
+
+def parse_rule(url):
+    """
+    解析 URL 规则，返回路径段列表
+    静态段为字符串，参数段为 (转换器名, 参数名) 元组
+    :param url: URL 规则，如 /user/<int:id>
+    """
+    segments = []
+    for part in url.split('/')[1:]:
+        if part.startswith('<') and part.endswith('>'):
+            # <name> 等价于 <str:name>
+            converter, _, name = part[1:-1].rpartition(':')
+            converter = converter or 'str'
+            if converter not in CONVERTER_MAP or not name:
+                raise ValueError('Invalid url rule: {}'.format(url))
+            segments.append((converter, name))
+        else:
+            segments.append(part)
+
+    # path 参数会吞掉后面所有路径段，所以必须在末尾
+    for segment in segments[:-1]:
+        if isinstance(segment, tuple) and segment[0] == 'path':
+            raise ValueError('Path converter must be the last part: {}'.format(url))
+    return segments
+
+
+class RouteNode:
+    """
+    路由树节点，每个节点对应一个路径段
+    """
+
+    __slots__ = ('static', 'dynamic', 'endpoint', 'names')
+
+    def __init__(self):
+        self.static = {}  # 静态路径段与子节点的映射
+        self.dynamic = []  # (转换器名, 转换器, 子节点) 列表，按优先级排序
+        self.endpoint = None  # 规则在此结束时对应的节点名
+        self.names = ()  # 规则在此结束时各个参数的名字
+
+    def get_dynamic(self, converter):
+        for item in self.dynamic:
+            if item[0] == converter:
+                return item[2]
+        node = RouteNode()
+        self.dynamic.append((converter, CONVERTER_MAP[converter](), node))
+        self.dynamic.sort(key=lambda item: item[1].weight)
+        return node
+
+
+class Router:
+    """
+    基于路由树的 URL 匹配器，添加规则时编译，匹配耗时只与路径段数量有关
+    """
+
+    def __init__(self):
+        self.root = RouteNode()
+
+    def add(self, url, endpoint):
+        """
+        添加 URL 规则，返回规则中的参数名元组
+        :param url: URL 规则
+        :param endpoint: 节点名
+        """
+        node = self.root
+        names = []
+        for segment in parse_rule(url):
+            if isinstance(segment, tuple):
+                converter, name = segment
+                node = node.get_dynamic(converter)
+                names.append(name)
+            else:
+                node = node.static.setdefault(segment, RouteNode())
+
+        # 参数名不同但结构相同的规则也视为已存在
+        if node.endpoint is not None:
+            raise exceptions.URLExistsError
+
+        node.endpoint = endpoint
+        node.names = tuple(names)
+        return node.names
+
+    def match(self, path):
+        """
+        匹配路径，成功返回 (节点名, 参数字典)，失败返回 None
+        :param path: 请求路径，如 /user/42
+        """
+        values = []
+        node = self._match(self.root, path.split('/')[1:], 0, values)
+        if node is None:
+            return None
+        return node.endpoint, dict(zip(node.names, values))
+
+    def _match(self, node, segments, index, values):
+        # 路径段已全部匹配，当前节点有节点名才算匹配成功
+        if index == len(segments):
+            return node if node.endpoint is not None else None
+
+        segment = segments[index]
+
+        # 优先匹配静态路径段
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, values)
+            if found is not None:
+                return found
+
+        # 再按优先级尝试参数路径段
+        for converter_name, converter, child in node.dynamic:
+            if converter_name == 'path':
+                if child.endpoint is None:
+                    continue
+                value = '/'.join(segments[index:])
+                try:
+                    values.append(converter.to_python(value))
+                except ValueError:
+                    continue
+                return child
+
+            try:
+                values.append(converter.to_python(segment))
+            except ValueError:
+                continue
+            found = self._match(child, segments, index + 1, values)
+            if found is not None:
+                return found
+            values.pop()
+
+        return None
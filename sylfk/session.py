@@ -1,8 +1,18 @@
+import atexit
 import base64
+import hashlib
+import hmac
+import json
 import os.path
+import secrets
+import threading
 import time
-import os
-import json
+import zlib
+from collections import OrderedDict
+
+import sylfk.exceptions as exceptions
+
+from sylfk.session_backend import FileSessionBackend
 
 
 def create_session_id():
@@ -10,9 +20,62 @@ def create_session_id():
     创建 Session ID （通常会存到客户端 Cookies 中的 session_id 中）
     """
 
-    # 获取当前时间戳，转化为字符串，编码为二进制字符串
-    # 使用 base64 加密后解码生成字符串，去掉最后两个字符 '=\n' 然后反转
-    return base64.encodebytes(str(time.time()).encode()).decode()[:-2][::-1]
+    # 使用密码学安全的随机数生成，并发请求也不会重复
+    return secrets.token_urlsafe(32)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(value):
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def sign_session(data, secret_key, compress=True):
+    """
+    把会话数据序列化为带 HMAC 签名的 Cookie 值，格式为 数据.时间戳.签名
+    数据压缩后更短时使用压缩结果，并以 . 开头标记
+    :param data: 会话数据
+    :param secret_key: 签名密钥
+    :param compress: 是否尝试压缩
+    """
+    payload = json.dumps(data, separators=(',', ':')).encode()
+    prefix = ''
+    if compress:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            payload, prefix = compressed, '.'
+    value = '{}{}.{}'.format(prefix, _b64encode(payload), int(time.time()))
+    signature = hmac.new(secret_key, value.encode(), hashlib.sha256).digest()
+    return '{}.{}'.format(value, _b64encode(signature))
+
+
+def unsign_session(value, secret_key, max_age=None):
+    """
+    校验 Cookie 值的签名和有效期并还原会话数据，校验失败时返回 None
+    :param value: Cookie 值
+    :param secret_key: 签名密钥
+    :param max_age: 有效期，单位秒
+    """
+    if not value:
+        return None
+    try:
+        value, signature = value.rsplit('.', 1)
+        expected = hmac.new(secret_key, value.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        payload, timestamp = value.rsplit('.', 1)
+        if max_age is not None and int(timestamp) + max_age < time.time():
+            return None
+        if payload.startswith('.'):
+            data = zlib.decompress(_b64decode(payload[1:]))
+        else:
+            data = _b64decode(payload)
+        data = json.loads(data.decode())
+    except (ValueError, zlib.error):
+        return None
+    return data if isinstance(data, dict) else None
 
 
 def get_session_id(request):
@@ -23,16 +86,52 @@ def get_session_id(request):
     return request.cookies.get('session_id')
 
 
+class SessionShard:
+    """
+    会话映射表的一个分片，每个分片有自己的锁，不同分片的会话可以并发读写
+    """
+
+    __slots__ = ('sessions', 'times', 'dirty', 'lock')
+
+    def __init__(self):
+        # 会话映射表，按最近访问顺序排列
+        self.sessions = OrderedDict()
+        self.times = {}  # Session ID 与 [创建时间, 最后访问时间] 的映射
+        self.dirty = set()  # 已修改但尚未持久化的 Session ID
+        self.lock = threading.RLock()
+
+
 class Session:
     """
     会话类，该类的实例为全局对象
     """
 
-    def __init__(self, session_path='session'):
-        self.__session_map__ = {}  # 会话映射表
+    def __init__(self, session_path='session', max_sessions=10000, shards=16):
+        # 会话映射表按 Session ID 的哈希值分成多个分片，每个分片一把锁
+        # 只保留最近访问的 max_sessions 个会话，其余会话留在后端，访问时再加载
+        self._shards = [SessionShard() for _ in range(shards)]
+        self.max_sessions = max_sessions
         self.__storage_path__ = session_path  # 会话本地存放路径
-        if not os.path.exists(self.__storage_path__):
-            os.makedirs(self.__storage_path__)
+        self.backend = FileSessionBackend(session_path)  # 会话存储后端，默认为文件
+        self.write_behind = False  # 是否延迟写入，由后台线程批量持久化
+        self.flush_interval = 1.0  # 后台线程批量写入的间隔，单位秒
+        self._flush_event = threading.Event()  # 通知后台线程退出
+        self._flush_thread = None  # 后台写入线程
+        self.idle_ttl = None  # 空闲过期时间，超过此秒数未访问的会话过期
+        self.absolute_ttl = None  # 绝对过期时间，创建超过此秒数的会话过期
+        self.sweep_interval = 60  # 后台清理的间隔，单位秒
+        self.sweep_batch_size = 1000  # 每次清理最多删除的会话数量
+        self._sweep_event = threading.Event()  # 通知后台清理线程退出
+        self._sweep_thread = None  # 后台清理线程
+        # 清理统计：清理次数、上一次从内存和文件中删除的数量、累计删除的数量
+        self.sweep_stats = {'sweeps': 0, 'removed_memory': 0, 'removed_files': 0,
+                            'total_removed': 0}
+        # 无状态模式的签名密钥，非空时会话数据存放在签名 Cookie 中，不经过服务端存储
+        self.cookie_secret = None
+        self.cookie_name = 'session'  # 存放会话数据的 Cookie 名
+        self.cookie_max_age = 14 * 24 * 3600  # Cookie 有效期，单位秒
+        self.cookie_max_size = 4000  # Cookie 值的最大字节数
+        self.cookie_compress = True  # 是否压缩会话数据
 
     def __new__(cls, *args, **kwargs):
         """
@@ -46,68 +145,401 @@ class Session:
         """
         更新或添加会话
         """
-        # 从请求中获取客户端的 Session ID
-        session_id = get_session_id(request)
+        # 无状态模式下直接修改 Cookie 中的会话数据，响应时写回 Cookie
+        if self.cookie_secret:
+            self._cookie_session(request)[item] = value
+            request._session_modified = True
+            return
 
-        # 如果这个 Session ID 已存在于映射表中，则直接为其添加新的数据键值对
-        # 如果不存在，则先初始化为空的字典，再添加数据键值对
-        if session_id in self.__session_map__:
-            self.__session_map__[session_id][item] = value
-        else:
-            self.__session_map__[session_id] = {item: value}
+        def update(current_session):
+            current_session[item] = value
+            return True
 
-        self.storage(session_id)
+        # 获取会话，如果不存在则初始化为空的字典，再添加数据键值对
+        self.modify(request, update, create=True)
 
     def pop(self, request, item, value=True):
         """
         删除当前会话的某个字段
         """
+        if self.cookie_secret:
+            current_session = self._cookie_session(request)
+            if item in current_session:
+                current_session.pop(item)
+                request._session_modified = True
+            return
+
+        def update(current_session):
+            # 判断数据项的键是否存在于当前的会话中，如果存在则删除
+            if item in current_session:
+                current_session.pop(item)
+                return True
+            return False
+
+        self.modify(request, update)
+
+    def modify(self, request, func, create=False):
+        """
+        原子地读取并修改当前请求的会话，返回 func 的返回值
+        func 接收会话数据字典，在分片锁内执行，返回真值表示数据有修改需要持久化
+        :param request: 请求对象
+        :param func: 修改函数
+        :param create: 会话不存在时是否创建空会话
+        """
         session_id = get_session_id(request)
-        current_session = self.__session_map__.get(session_id, {})
+        if self.load(session_id, create=create) is None:
+            return None
+
+        shard = self._shard(session_id)
+        with shard.lock:
+            # 加锁后重新获取，会话可能在此之前被淘汰或清理
+            current_session = shard.sessions.get(session_id)
+            if current_session is None:
+                current_session = self.load(session_id, create=create)
+                if current_session is None:
+                    return None
+            modified = func(current_session)
+            if modified:
+                self.storage(session_id)
+        return modified
+
+    def _shard(self, session_id):
+        # 根据 Session ID 的哈希值选择分片
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def load(self, session_id, create=False):
+        """
+        获取会话数据，不在内存中时从文件加载，不存在或已过期时返回 None
+        :param session_id: Session ID
+        :param create: 不存在时是否创建空会话
+        """
+        if not self.is_valid_id(session_id):
+            return None
+
+        now = time.time()
+        expired = False
+        shard = self._shard(session_id)
+        with shard.lock:
+            data = shard.sessions.get(session_id)
+            if data is not None:
+                times = shard.times[session_id]
+                if not self.is_expired(times[0], times[1], now):
+                    times[1] = now
+                    shard.sessions.move_to_end(session_id)
+                    return data
+                self._forget(shard, session_id)
+                expired = True
 
-        # 判断数据项的键是否存在于当前的会话中，如果存在则删除
-        if item in current_session:
-            current_session.pop(item)
-            self.storage(session_id)
+        data = None
+        created = now
+        if expired:
+            self.backend.delete((session_id,))
+        else:
+            loaded = self.backend.load(session_id)
+            if loaded is not None:
+                data, created, accessed = loaded
+                if self.is_expired(created, accessed, now):
+                    self.backend.delete((session_id,))
+                    data, created = None, now
+
+        if data is None:
+            if not create:
+                return None
+            data = {}
+
+        with shard.lock:
+            # 其他线程可能已经加载了同一个会话，以先加载的为准
+            if session_id in shard.sessions:
+                data = shard.sessions[session_id]
+                shard.times[session_id][1] = now
+            else:
+                shard.sessions[session_id] = data
+                shard.times[session_id] = [created, now]
+            shard.sessions.move_to_end(session_id)
+            self._evict(shard)
+        return data
+
+    def _evict(self, shard):
+        # 淘汰分片中最久未访问的会话，尚未持久化的会话先写入后端
+        # 并记录最后访问时间，供过期清理使用
+        limit = max(1, self.max_sessions // len(self._shards))
+        while len(shard.sessions) > limit:
+            session_id, data = shard.sessions.popitem(last=False)
+            created, accessed = shard.times.pop(session_id)
+            if session_id in shard.dirty:
+                shard.dirty.discard(session_id)
+                self.backend.save_many([(session_id, data, created, accessed)])
+            self.backend.touch(session_id, accessed)
+
+    @staticmethod
+    def _forget(shard, session_id):
+        # 从内存中删除会话，不再写入后端
+        shard.sessions.pop(session_id, None)
+        shard.times.pop(session_id, None)
+        shard.dirty.discard(session_id)
+
+    def _is_active(self, session_id):
+        # 判断会话是否在内存中
+        return session_id in self._shard(session_id).sessions
+
+    @staticmethod
+    def is_valid_id(session_id):
+        """
+        判断 Session ID 是否可以作为文件名，防止通过 Cookie 访问存放目录以外的文件
+        """
+        return bool(session_id) and not session_id.startswith('.') \
+            and os.path.basename(session_id) == session_id
+
+    def is_expired(self, created, accessed, now=None):
+        """
+        判断会话是否过期
+        :param created: 创建时间
+        :param accessed: 最后访问时间
+        :param now: 当前时间，为空时取当前时间
+        """
+        now = time.time() if now is None else now
+        if self.idle_ttl and accessed + self.idle_ttl < now:
+            return True
+        if self.absolute_ttl and created + self.absolute_ttl < now:
+            return True
+        return False
 
     def set_storage_path(self, session_path):
         """
-        修改存放会话数据的目录
+        修改存放会话数据的目录，同时切换为文件存储后端
         """
         self.__storage_path__ = session_path
-        if not os.path.exists(self.__storage_path__):
-            os.makedirs(self.__storage_path__)
+        self.set_backend(FileSessionBackend(session_path))
 
-    def storage(self, session_id):
+    def set_backend(self, backend):
+        """
+        切换会话存储后端，切换前先写入尚未持久化的会话并清空内存中的会话
+        :param backend: SessionBackend 子类的实例，如 SQLiteSessionBackend('session.db')
+        """
+        self.flush()
+        for shard in self._shards:
+            with shard.lock:
+                shard.sessions.clear()
+                shard.times.clear()
+        old, self.backend = self.backend, backend
+        old.close()
+
+    def set_write_behind(self, enabled=True, interval=None):
         """
-        会话持久化
+        开启或关闭延迟写入模式
+        开启后 push 和 pop 只标记会话已修改，由后台线程定时批量写入文件，
+        进程退出时会写入剩余的修改
+        :param enabled: 是否开启
+        :param interval: 批量写入的间隔，单位秒
         """
-        filename = os.path.join(self.__storage_path__, session_id)
+        if interval is not None:
+            self.flush_interval = interval
 
-        with open(filename, 'wb') as f:
-            content = json.dumps(self.__session_map__.get(session_id))
-            f.write(base64.encodebytes(content.encode()))
+        if not enabled:
+            self.write_behind = False
+            self.stop_flusher()
+            return
 
-    def load_all_session(self):
+        self.write_behind = True
+        if self._flush_thread is None:
+            self._flush_event.clear()
+            self._flush_thread = threading.Thread(target=self._flush_loop,
+                                                  name='session-flusher', daemon=True)
+            self._flush_thread.start()
+
+    def stop_flusher(self):
+        """
+        停止后台写入线程并写入剩余的修改
+        """
+        thread = self._flush_thread
+        if thread is not None:
+            self._flush_event.set()
+            thread.join()
+            self._flush_thread = None
+        self.flush()
+
+    def _flush_loop(self):
+        # 每隔 flush_interval 秒批量写入一次，直到收到退出通知
+        while not self._flush_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        把所有已修改的会话批量写入后端，返回写入的数量
+        """
+        items = []
+        for shard in self._shards:
+            with shard.lock:
+                dirty, shard.dirty = shard.dirty, set()
+                for session_id in dirty:
+                    data = shard.sessions.get(session_id)
+                    # 已被淘汰的会话在淘汰时已经写入
+                    if data is None:
+                        continue
+                    created, accessed = shard.times[session_id]
+                    # 复制一份，序列化时不受其他线程修改的影响
+                    items.append((session_id, dict(data), created, accessed))
+
+        if items:
+            self.backend.save_many(items)
+        return len(items)
+
+    def set_expiry(self, idle_ttl=None, absolute_ttl=None, interval=None, batch_size=None):
+        """
+        设置会话过期时间，并启动后台线程定时清理过期会话
+        两个过期时间都为空时停止清理
+        :param idle_ttl: 空闲过期时间，单位秒
+        :param absolute_ttl: 绝对过期时间，单位秒
+        :param interval: 清理间隔，单位秒
+        :param batch_size: 每次清理最多删除的会话数量
+        """
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        if interval is not None:
+            self.sweep_interval = interval
+        if batch_size is not None:
+            self.sweep_batch_size = batch_size
+
+        if not (idle_ttl or absolute_ttl):
+            self.stop_sweeper()
+            return
+
+        if self._sweep_thread is None:
+            self._sweep_event.clear()
+            self._sweep_thread = threading.Thread(target=self._sweep_loop,
+                                                  name='session-sweeper', daemon=True)
+            self._sweep_thread.start()
+
+    def stop_sweeper(self):
+        """
+        停止后台清理线程
         """
-        加载本地文件中的会话数据
+        thread = self._sweep_thread
+        if thread is not None:
+            self._sweep_event.set()
+            thread.join()
+            self._sweep_thread = None
+
+    def _sweep_loop(self):
+        # 每隔 sweep_interval 秒清理一次，直到收到退出通知
+        while not self._sweep_event.wait(self.sweep_interval):
+            self.sweep()
+
+    def sweep(self):
+        """
+        清理过期会话，先清理内存中的会话，再清理后端中的会话
+        每次最多删除 sweep_batch_size 个，剩余的留到下一次，返回本次的统计
         """
-        session_file_list = os.listdir(self.__storage_path__)
+        if not (self.idle_ttl or self.absolute_ttl):
+            return {'removed_memory': 0, 'removed_files': 0}
+
+        now = time.time()
+        batch_size = self.sweep_batch_size
+
+        expired = []
+        for shard in self._shards:
+            with shard.lock:
+                for session_id, (created, accessed) in list(shard.times.items()):
+                    if len(expired) >= batch_size:
+                        break
+                    if self.is_expired(created, accessed, now):
+                        self._forget(shard, session_id)
+                        expired.append(session_id)
+
+        removed_files = self.backend.delete(expired) if expired else 0
 
-        for session_id in session_file_list:
-            filename = os.path.join(self.__storage_path__, session_id)
-            with open(filename, 'rb') as f:
-                content = f.read()
-            # 把文件内容进行 base64 解码
-            content = base64.decodebytes(content)
-            # 把 Session ID 与对应的会话内容绑定到回话映射表中
-            self.__session_map__[session_id] = json.loads(content.decode())
+        # 再清理只存在于后端中的过期会话
+        removed_disk_only = self.backend.purge(
+            now - self.idle_ttl if self.idle_ttl else None,
+            now - self.absolute_ttl if self.absolute_ttl else None,
+            batch_size - len(expired), self._is_active) if batch_size > len(expired) else 0
+        removed_files += removed_disk_only
+
+        stats = self.sweep_stats
+        stats['sweeps'] += 1
+        stats['removed_memory'] = len(expired)
+        stats['removed_files'] = removed_files
+        stats['total_removed'] += len(expired) + removed_disk_only
+        return {'removed_memory': len(expired), 'removed_files': removed_files}
+
+    def storage(self, session_id):
+        """
+        会话持久化，延迟写入模式下只标记为已修改
+        """
+        shard = self._shard(session_id)
+        with shard.lock:
+            if session_id not in shard.sessions:
+                return
+            if self.write_behind:
+                shard.dirty.add(session_id)
+                return
+            # 同步写入在分片锁内完成，保证同一会话的写入顺序与修改顺序一致
+            created, accessed = shard.times[session_id]
+            self.backend.save_many([(session_id, dict(shard.sessions[session_id]),
+                                     created, accessed)])
+
+    def load_all_session(self):
+        """
+        加载后端中的会话数据
+        会话已改为访问时加载，启动时不再需要调用此方法
+        """
+        for session_id in list(self.backend.ids()):
+            self.load(session_id)
 
     def get(self, request):
         """
         获取当前请求相关的会话数据
         """
-        return self.__session_map__.get(get_session_id(request), {})
+        if self.cookie_secret:
+            return self._cookie_session(request)
+        return self.load(get_session_id(request)) or {}
+
+    def set_cookie_mode(self, secret_key, max_age=None, max_size=None, compress=True,
+                        cookie_name=None):
+        """
+        开启无状态模式，会话数据经 HMAC 签名后存放在客户端 Cookie 中
+        各个进程不需要共享服务端存储，负载均衡时不需要会话保持
+        :param secret_key: 签名密钥，为空时关闭无状态模式
+        :param max_age: Cookie 有效期，单位秒
+        :param max_size: Cookie 值的最大字节数，超出时抛出 SessionTooLargeError
+        :param compress: 是否压缩会话数据
+        :param cookie_name: 存放会话数据的 Cookie 名
+        """
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode()
+        self.cookie_secret = secret_key or None
+        self.cookie_compress = compress
+        if max_age is not None:
+            self.cookie_max_age = max_age
+        if max_size is not None:
+            self.cookie_max_size = max_size
+        if cookie_name is not None:
+            self.cookie_name = cookie_name
+
+    def _cookie_session(self, request):
+        # 解析请求 Cookie 中的会话数据，同一个请求只解析一次
+        # 通过 vars 读取，避免触发请求对象的延迟属性
+        data = vars(request).get('_session_data')
+        if data is None:
+            data = unsign_session(request.cookies.get(self.cookie_name),
+                                  self.cookie_secret, self.cookie_max_age) or {}
+            request._session_data = data
+        return data
+
+    def save_cookie(self, request, response):
+        """
+        无状态模式下，把本次请求修改过的会话数据写入响应的 Cookie
+        :param request: 请求对象
+        :param response: 响应对象
+        """
+        if not self.cookie_secret or not vars(request).get('_session_modified'):
+            return
+        value = sign_session(request._session_data, self.cookie_secret,
+                             self.cookie_compress)
+        if len(value) > self.cookie_max_size:
+            raise exceptions.SessionTooLargeError
+        response.set_cookie(self.cookie_name, value, max_age=self.cookie_max_age,
+                            httponly=True, samesite='Lax')
 
     def get_item(self, request, item):
         """
@@ -126,9 +558,10 @@ class AuthSession:
         """
         效验装饰器
         """
-        def decorator(obj, request):
+        def decorator(obj, request, *view_args, **view_options):
+            # 路径参数通过 view_args 和 view_options 转发给视图方法
             if cls.auth_logic(request, *args, **options):
-                return f(obj, request)
+                return f(obj, request, *view_args, **view_options)
             return cls.auth_fail_callback(request, *args, **options)
 
         return decorator
@@ -150,3 +583,6 @@ class AuthSession:
 
 # 单例全局对象
 session = Session()
+
+# 进程退出前写入延迟写入模式下尚未持久化的会话
+atexit.register(session.stop_flusher)
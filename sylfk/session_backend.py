@@ -0,0 +1,232 @@
+# 会话存储后端模块
+import base64
+import json
+import os
+import sqlite3
+import threading
+
+
+class SessionBackend:
+    """
+    会话存储后端基类，子类实现会话数据的读取、批量写入和删除
+    会话数据以 (数据, 创建时间, 最后访问时间) 的形式保存
+    """
+
+    def load(self, session_id):
+        """
+        读取会话，返回 (数据, 创建时间, 最后访问时间)，不存在时返回 None
+        """
+        raise NotImplementedError
+
+    def save_many(self, items):
+        """
+        批量写入会话
+        :param items: (Session ID, 数据, 创建时间, 最后访问时间) 列表
+        """
+        raise NotImplementedError
+
+    def delete(self, session_ids):
+        """
+        删除会话，返回删除的数量
+        """
+        raise NotImplementedError
+
+    def touch(self, session_id, accessed):
+        """
+        只更新会话的最后访问时间
+        """
+        raise NotImplementedError
+
+    def purge(self, idle_before, created_before, limit, is_active):
+        """
+        删除过期会话，返回删除的数量
+        :param idle_before: 最后访问早于此时间的会话过期，为 None 时不判断
+        :param created_before: 创建早于此时间的会话过期，为 None 时不判断
+        :param limit: 最多删除的数量
+        :param is_active: 判断会话是否在内存中，内存中的会话由调用方判断，这里跳过
+        """
+        raise NotImplementedError
+
+    def ids(self):
+        """
+        返回全部 Session ID 的迭代器
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        释放后端占用的资源
+        """
+
+
+class FileSessionBackend(SessionBackend):
+    """
+    文件存储后端，每个会话一个文件，文件内容为 base64 编码的 JSON
+    文件修改时间记录最后访问时间
+    """
+
+    def __init__(self, path='session'):
+        self.path = path  # 会话文件存放目录
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def load(self, session_id):
+        # 文件不存在或内容损坏时返回 None
+        filename = os.path.join(self.path, session_id)
+        try:
+            with open(filename, 'rb') as f:
+                content = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+            # 把文件内容进行 base64 解码
+            content = json.loads(base64.decodebytes(content).decode())
+        except (OSError, ValueError):
+            return None
+        # 旧格式的文件只有会话数据，以修改时间作为创建时间
+        if isinstance(content, dict) and '__data__' in content:
+            return content['__data__'], content.get('__created__') or mtime, mtime
+        return content, mtime, mtime
+
+    def save_many(self, items):
+        for session_id, data, created, accessed in items:
+            filename = os.path.join(self.path, session_id)
+            # 会话数据和创建时间一起保存，用于判断绝对过期
+            content = json.dumps({'__created__': created, '__data__': data})
+
+            # 先写临时文件再重命名，保证文件内容总是完整的
+            tmp_filename = '{}.{}.tmp'.format(filename, threading.get_ident())
+            with open(tmp_filename, 'wb') as f:
+                f.write(base64.encodebytes(content.encode()))
+            os.replace(tmp_filename, filename)
+
+    def delete(self, session_ids):
+        count = 0
+        for session_id in session_ids:
+            try:
+                os.remove(os.path.join(self.path, session_id))
+                count += 1
+            except OSError:
+                pass
+        return count
+
+    def touch(self, session_id, accessed):
+        try:
+            os.utime(os.path.join(self.path, session_id), (accessed, accessed))
+        except OSError:
+            pass
+
+    def purge(self, idle_before, created_before, limit, is_active):
+        # 不在内存中的会话，最后访问时间不早于文件修改时间，
+        # 创建时间不晚于文件修改时间，所以修改时间早于任一截止时间的文件都已过期
+        cutoff = max(t for t in (idle_before, created_before) if t is not None)
+        count = 0
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if count >= limit:
+                    break
+                if is_active(entry.name):
+                    continue
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                count += 1
+        return count
+
+    def ids(self):
+        for name in os.listdir(self.path):
+            # 跳过写入中断后残留的临时文件
+            if not name.endswith('.tmp'):
+                yield name
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    SQLite 存储后端，全部会话存放在一个数据库文件中
+    使用 WAL 日志模式，写入按批在一个事务中完成，过期会话批量删除后增量回收空间
+    """
+
+    def __init__(self, path='session.db'):
+        self.path = path  # 数据库文件路径
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # 增量回收空间需要在建表前设置
+        self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS session (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS session_accessed ON session (accessed)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS session_created ON session (created)')
+
+    def load(self, session_id):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT data, created, accessed FROM session WHERE id = ?',
+                (session_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def save_many(self, items):
+        rows = [(session_id, json.dumps(data), created, accessed)
+                for session_id, data, created, accessed in items]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO session (id, data, created, accessed) '
+                'VALUES (?, ?, ?, ?)', rows)
+
+    def delete(self, session_ids):
+        with self._lock, self.conn:
+            cursor = self.conn.executemany('DELETE FROM session WHERE id = ?',
+                                           [(session_id,) for session_id in session_ids])
+            return cursor.rowcount
+
+    def touch(self, session_id, accessed):
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE session SET accessed = ? WHERE id = ?',
+                              (accessed, session_id))
+
+    def purge(self, idle_before, created_before, limit, is_active):
+        # 两个截止时间分别走各自的索引
+        conditions, params = [], []
+        if idle_before is not None:
+            conditions.append('accessed < ?')
+            params.append(idle_before)
+        if created_before is not None:
+            conditions.append('created < ?')
+            params.append(created_before)
+        sql = 'SELECT id FROM session WHERE {} LIMIT ?'.format(' OR '.join(conditions))
+        with self._lock:
+            rows = self.conn.execute(sql, params + [limit]).fetchall()
+        expired = [row[0] for row in rows if not is_active(row[0])]
+        if not expired:
+            return 0
+        count = self.delete(expired)
+        with self._lock:
+            self.conn.execute('PRAGMA incremental_vacuum').fetchall()
+        return count
+
+    def compact(self):
+        """
+        回收数据库文件的全部空闲空间并清空 WAL 日志
+        """
+        with self._lock:
+            self.conn.execute('VACUUM')
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def ids(self):
+        with self._lock:
+            rows = self.conn.execute('SELECT id FROM session').fetchall()
+        return (row[0] for row in rows)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
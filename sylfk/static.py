@@ -0,0 +1,345 @@
+# 静态资源缓存模块
+import gzip
+import hashlib
+import json
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags, quote_etag
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+from sylfk.helper import parse_static_key
+
+# 值得预压缩的文本类静态资源后缀
+COMPRESS_TYPES = ('css', 'js', 'html', 'json', 'svg', 'txt')
+
+# 静态资源指纹清单的文件名，存放在静态资源目录下
+MANIFEST_NAME = 'manifest.json'
+
+# 带指纹的静态资源内容不会变化，允许客户端缓存一年且不再校验
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def make_etag(st):
+    """
+    由文件大小和纳秒级修改时间生成 ETag，不需要读取文件内容
+    :param st: os.stat 的结果
+    """
+    return quote_etag('{:x}-{:x}'.format(st.st_size, st.st_mtime_ns))
+
+
+class StaticFile:
+    """
+    静态文件缓存条目，保存文件内容和校验信息
+    """
+
+    __slots__ = ('path', 'data', 'size', 'mtime', 'mtime_ns', 'etag', 'last_modified')
+
+    def __init__(self, path, data, st):
+        self.path = path  # 文件路径
+        self.data = data  # 文件内容，未缓存的大文件为 None
+        self.size = st.st_size  # 文件大小
+        self.mtime = int(st.st_mtime)  # 修改时间，HTTP 日期只精确到秒
+        self.mtime_ns = st.st_mtime_ns  # 纳秒级修改时间，用于判断文件是否变化
+        self.etag = make_etag(st)
+        self.last_modified = http_date(self.mtime)
+
+    def same_as(self, st):
+        """判断缓存条目和文件当前状态是否一致"""
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns
+
+
+class StaticCache:
+    """
+    按字节数限制大小的静态文件 LRU 缓存
+    每次读取都会 stat 一次文件，修改时间或大小变化时重新读取
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_file_size=1024 * 1024):
+        self.max_bytes = max_bytes  # 缓存总字节数上限
+        self.max_file_size = max_file_size  # 超过此大小的文件不缓存内容
+        self.bytes = 0  # 当前缓存的字节数
+        self.hits = 0  # 命中次数
+        self.misses = 0  # 未命中次数
+        self._entries = OrderedDict()  # 文件路径与缓存条目的映射
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        获取文件对应的缓存条目，文件不存在时抛出 OSError
+        :param path: 文件路径
+        """
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.same_as(st):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # 大文件只返回校验信息，不读入内存
+        data = None
+        if st.st_size <= self.max_file_size:
+            with open(path, 'rb') as f:
+                data = f.read()
+        entry = StaticFile(path, data, st)
+
+        if data is not None:
+            self._put(entry)
+        return entry
+
+    def _put(self, entry):
+        with self._lock:
+            old = self._entries.pop(entry.path, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._entries[entry.path] = entry
+            self.bytes += entry.size
+            # 超出上限时淘汰最久未使用的条目
+            while self.bytes > self.max_bytes and self._entries:
+                _, old = self._entries.popitem(last=False)
+                self.bytes -= old.size
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """返回缓存统计信息，用于调整缓存大小"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def is_not_modified(environ, static_file):
+    """
+    根据请求的 If-None-Match 和 If-Modified-Since 报头判断客户端缓存是否仍有效
+    :param environ: 请求信息字典
+    :param static_file: 静态文件缓存条目
+    """
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    # 两个报头同时存在时只看 If-None-Match
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(static_file.etag.strip('"'))
+
+    if_modified_since = parse_date(environ.get('HTTP_IF_MODIFIED_SINCE'))
+    if if_modified_since is not None:
+        return static_file.mtime <= if_modified_since.timestamp()
+    return False
+
+
+class FileResponse(Response):
+    """
+    流式文件响应，不把文件读入内存
+    服务器提供 wsgi.file_wrapper 时交给它发送（如 sendfile），否则分块读取
+    支持 Range 请求，返回 206 Partial Content 以便断点续传
+    """
+
+    def __init__(self, path, content_type=None, headers=None, buffer_size=64 * 1024):
+        self._file = open(path, 'rb')
+        super().__init__(None, content_type=content_type, headers=headers,
+                         direct_passthrough=True)
+        st = os.fstat(self._file.fileno())
+        self.file_size = st.st_size  # 文件完整大小
+        self.buffer_size = buffer_size  # 分块读取时每块的大小
+        self.content_length = st.st_size
+        # 续传时客户端用 If-Range 比对校验信息，这里补齐缺失的报头
+        self.headers.setdefault('ETag', make_etag(st))
+        self.headers.setdefault('Last-Modified', http_date(int(st.st_mtime)))
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+    def __call__(self, environ, start_response):
+        # 响应体在发送时才包装，这时才能拿到服务器提供的 wsgi.file_wrapper
+        self.response = wrap_file(environ, self._file, self.buffer_size)
+        try:
+            # 处理 Range、If-Range 等报头，满足条件时改为 206 并只发送对应区间
+            self.make_conditional(environ, accept_ranges=True,
+                                  complete_length=self.file_size)
+        except RequestedRangeNotSatisfiable as e:
+            self.close()
+            return e(environ, start_response)
+        return super().__call__(environ, start_response)
+
+
+def accepts_gzip(environ):
+    """
+    判断客户端是否接受 gzip 编码的响应体
+    :param environ: 请求信息字典
+    """
+    value = environ.get('HTTP_ACCEPT_ENCODING')
+    if not value:
+        return False
+    return parse_accept_header(value).quality('gzip') > 0
+
+
+def compress_static(folder, min_size=256, level=9):
+    """
+    为目录下的文本类静态资源生成 .gz 压缩文件，返回生成的文件数量
+    压缩文件已是最新或压缩后没有变小的文件会被跳过
+    :param folder: 静态资源目录
+    :param min_size: 小于此字节数的文件不压缩
+    :param level: gzip 压缩级别
+    """
+    count = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if parse_static_key(name) not in COMPRESS_TYPES:
+                continue
+            path = os.path.join(root, name)
+            gz_path = path + '.gz'
+            st = os.stat(path)
+            if st.st_size < min_size:
+                continue
+            # 按纳秒比较，与服务时的判断一致，同一秒内修改过的原文件也会重新压缩
+            if os.path.exists(gz_path) and os.stat(gz_path).st_mtime_ns >= st.st_mtime_ns:
+                continue
+
+            with open(path, 'rb') as f:
+                data = gzip.compress(f.read(), compresslevel=level, mtime=0)
+            if len(data) >= st.st_size:
+                continue
+
+            # 先写临时文件再重命名，避免服务中的进程读到写了一半的文件
+            tmp_path = gz_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, gz_path)
+            count += 1
+    return count
+
+
+def fingerprint_name(name, digest):
+    """
+    在文件后缀前插入指纹，如 app.js -> app.abc123.js
+    :param name: 文件名
+    :param digest: 文件内容的摘要
+    """
+    base, dot, ext = name.rpartition('.')
+    if not dot or '/' in ext:
+        return '{}.{}'.format(name, digest)
+    return '{}.{}.{}'.format(base, digest, ext)
+
+
+def build_manifest(folder, digest_size=8):
+    """
+    计算目录下每个静态资源的内容摘要，生成逻辑文件名与带指纹文件名的清单
+    清单写入目录下的 manifest.json 并返回，带指纹的文件名只是虚拟路径，不会复制文件，
+    同时记录文件的大小和修改时间，文件修改后未重新生成清单时，旧的指纹不再生效
+    :param folder: 静态资源目录
+    :param digest_size: 指纹的长度
+    """
+    manifest = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            # 跳过清单本身和预压缩文件，压缩文件随原文件一起解析
+            if name == MANIFEST_NAME or name.endswith(('.gz', '.tmp')):
+                continue
+            path = os.path.join(root, name)
+            md5 = hashlib.md5()
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    md5.update(chunk)
+            logical = os.path.relpath(path, folder).replace(os.sep, '/')
+            manifest[logical] = {
+                'name': fingerprint_name(logical, md5.hexdigest()[:digest_size]),
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+            }
+
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+class StaticManifest:
+    """
+    静态资源指纹清单，该类的实例为全局对象
+    负责把逻辑文件名解析为带指纹的 URL，以及把带指纹的请求路径还原为真实文件
+    """
+
+    def __init__(self):
+        self.folder = 'static'  # 静态资源目录
+        self.assets = {}  # 逻辑文件名与带指纹文件名的映射
+        self.stats = {}  # 真实文件路径与生成清单时的 (大小, 修改时间) 的映射
+        self.reverse = {}  # 带指纹的文件路径与真实文件路径的映射
+
+    def load(self, folder):
+        """
+        加载静态资源目录下的清单文件，文件不存在时清单为空
+        :param folder: 静态资源目录
+        """
+        self.folder = folder
+        path = os.path.join(folder, MANIFEST_NAME)
+        entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                entries = json.load(f)
+        assets, stats, reverse = {}, {}, {}
+        for logical, entry in entries.items():
+            # 旧格式的清单没有记录文件状态，无法判断指纹是否有效，需要重新生成
+            if not isinstance(entry, dict):
+                continue
+            real_path = '{}/{}'.format(folder, logical)
+            assets[logical] = entry['name']
+            stats[real_path] = (entry['size'], entry['mtime_ns'])
+            reverse['{}/{}'.format(folder, entry['name'])] = real_path
+        self.assets = assets
+        self.stats = stats
+        self.reverse = reverse
+
+    def resolve(self, static_path):
+        """
+        把带指纹的文件路径还原为真实文件路径，不是带指纹的路径时返回 None
+        :param static_path: 请求的文件路径，如 static/app.abc123.js
+        """
+        return self.reverse.get(static_path)
+
+    def is_current(self, real_path, size, mtime_ns):
+        """
+        判断文件是否与生成清单时相同，文件修改后指纹对应的内容已不存在
+        :param real_path: 真实文件路径
+        :param size: 文件当前的大小
+        :param mtime_ns: 文件当前的修改时间
+        """
+        return self.stats.get(real_path) == (size, mtime_ns)
+
+    def url_for(self, name):
+        """
+        返回静态资源的 URL，清单中有记录且文件未修改时使用带指纹的文件名，否则使用原文件名
+        :param name: 相对于静态资源目录的逻辑文件名，如 app.js
+        """
+        hashed = self.assets.get(name)
+        if hashed is not None:
+            real_path = '{}/{}'.format(self.folder, name)
+            try:
+                st = os.stat(real_path)
+            except OSError:
+                st = None
+            if st is not None and self.is_current(real_path, st.st_size, st.st_mtime_ns):
+                return '/{}/{}'.format(self.folder, hashed)
+        return '/{}/{}'.format(self.folder, name)
+
+
+# 单例全局对象
+static_manifest = StaticManifest()
@@ -1,46 +1,328 @@
+import hashlib
+import json
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
 
 # 模板标记
 pattern = r'{{(.*?)}}'
 
+# 预编译的模板标记匹配对象
+comp = re.compile(pattern)
+
+# 找不到本地模板文件时返回的内容
+NOT_FOUND_CONTENT = '<h1>Not Found Tmeplate.</h1>'
+
 
 def parse_args(obj):
     """
     解析模板
     """
-    comp = re.compile(pattern)  # 创建匹配对象
     result = comp.findall(obj)  # 获取匹配结果
 
     return result or ()
 
 
-def replace_template(app, path, **options):
+class CompiledTemplate:
+    """
+    编译后的模板，由文本片段和变量名交替组成，渲染时只需拼接一次
+    """
+
+    __slots__ = ('source', 'parts', 'slots', 'mtime_ns', 'size')
+
+    def __init__(self, source, mtime_ns=None, size=None, parts=None):
+        self.source = source  # 模板原文
+        self.mtime_ns = mtime_ns  # 模板文件的修改时间，用于判断缓存是否过期
+        self.size = size  # 模板文件大小
+        # re.split 的结果中奇数下标为标记内容，偶数下标为标记之间的文本
+        # 从持久化的编译结果加载时直接使用已切分好的 parts
+        if parts is None:
+            parts = comp.split(source)
+        self.parts = parts
+        # (下标, 键) 列表，渲染时按下标把变量值填回 parts 的副本
+        self.slots = [(i, parts[i].strip()) for i in range(1, len(parts), 2)]
+
+    def render(self, options):
+        """
+        渲染模板，键不存在于置换数据中时替换为空
+        :param options: 参数字典
+        """
+        # 置换内容为空时不做置换，保持原文
+        if not options:
+            return self.source
+        parts = self.parts[:]
+        for index, key in self.slots:
+            parts[index] = str(options.get(key, ''))
+        return ''.join(parts)
+
+    def stream(self, options, chunk_size=8192):
+        """
+        流式渲染模板，每凑够 chunk_size 个字符生成一块
+        值为迭代器（如生成器）时逐项展开输出，不需要先拼成完整字符串
+        :param options: 参数字典
+        :param chunk_size: 每块的大致字符数
+        """
+        if not options:
+            yield self.source
+            return
+
+        buffer = []
+        size = 0
+        for index, part in enumerate(self.parts):
+            if index % 2 == 0:
+                values = (part,)
+            else:
+                value = options.get(part.strip(), '')
+                values = value if isinstance(value, Iterator) else (value,)
+
+            for value in values:
+                value = str(value)
+                buffer.append(value)
+                size += len(value)
+                if size >= chunk_size:
+                    yield ''.join(buffer)
+                    buffer = []
+                    size = 0
+
+        if buffer:
+            yield ''.join(buffer)
+
+
+# 模板文件路径与编译结果的映射
+_template_cache = {}
+_template_lock = threading.Lock()
+
+
+def get_template(path):
+    """
+    获取编译后的模板，模板文件修改后重新编译，文件不存在时返回 None
+    :param path: 模板文件本地路径
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    template = _template_cache.get(path)
+    if template is not None and template.mtime_ns == st.st_mtime_ns \
+            and template.size == st.st_size:
+        return template
+
+    with open(path, 'rb') as f:
+        content = f.read().decode()
+    template = CompiledTemplate(content, st.st_mtime_ns, st.st_size)
+    with _template_lock:
+        _template_cache[path] = template
+    return template
+
+
+def clear_template_cache():
+    """
+    清空模板缓存
+    """
+    with _template_lock:
+        _template_cache.clear()
+
+
+def precompile_templates(folder):
+    """
+    编译目录下的全部模板文件并放入缓存，返回编译的模板数量
+    :param folder: 模板目录
+    """
+    count = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if get_template(os.path.join(root, name)) is not None:
+                count += 1
+    return count
+
+
+def save_compiled_templates(cache_dir):
+    """
+    把缓存中的编译结果以 JSON 格式写入缓存目录
+    :param cache_dir: 编译结果存放目录
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    with _template_lock:
+        data = {
+            path: {
+                'mtime_ns': template.mtime_ns,
+                'size': template.size,
+                'source': template.source,
+                'parts': template.parts,
+            }
+            for path, template in _template_cache.items()
+        }
+    filename = os.path.join(cache_dir, 'templates.json')
+    # 先写临时文件再重命名，避免其他进程读到写了一半的文件
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(filename + '.tmp', filename)
+    return len(data)
+
+
+def load_compiled_templates(cache_dir):
+    """
+    从缓存目录加载编译结果，模板文件已修改或已删除的条目会被丢弃，返回加载的数量
+    :param cache_dir: 编译结果存放目录
+    """
+    filename = os.path.join(cache_dir, 'templates.json')
+    if not os.path.exists(filename):
+        return 0
+    with open(filename) as f:
+        data = json.load(f)
+
+    count = 0
+    for path, item in data.items():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if st.st_mtime_ns != item['mtime_ns'] or st.st_size != item['size']:
+            continue
+        template = CompiledTemplate(item['source'], item['mtime_ns'], item['size'],
+                                    parts=item['parts'])
+        with _template_lock:
+            _template_cache[path] = template
+        count += 1
+    return count
+
+
+class RenderCache:
+    """
+    模板渲染结果缓存，按模板路径和参数摘要存放
+    条目超过有效期或模板文件修改后失效，总字符数超出上限时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_size=16 * 1024 * 1024, ttl=60):
+        self.max_size = max_size  # 缓存内容的总字符数上限
+        self.ttl = ttl  # 默认有效期，单位秒
+        self.size = 0  # 当前缓存的总字符数
+        self.hits = 0  # 命中次数
+        self.misses = 0  # 未命中次数
+        self._entries = OrderedDict()  # 键与 (内容, 模板修改时间, 过期时间) 的映射
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path, options):
+        """
+        由模板路径和参数生成缓存键，参数按键排序后序列化，保证相同参数得到相同的键
+        :param path: 模板文件本地路径
+        :param options: 参数字典
+        """
+        data = json.dumps(options, sort_keys=True, default=repr)
+        return path, hashlib.md5(data.encode()).hexdigest()
+
+    def get(self, key, mtime_ns):
+        """
+        获取缓存内容，不存在、已过期或模板已修改时返回 None
+        :param key: 缓存键
+        :param mtime_ns: 模板文件当前的修改时间
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                content, entry_mtime_ns, expires = entry
+                if entry_mtime_ns == mtime_ns and expires > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return content
+                del self._entries[key]
+                self.size -= len(content)
+            self.misses += 1
+            return None
+
+    def put(self, key, mtime_ns, content, ttl=None):
+        """
+        存放渲染结果
+        :param key: 缓存键
+        :param mtime_ns: 渲染时模板文件的修改时间
+        :param content: 渲染结果
+        :param ttl: 有效期，为空时使用默认有效期
+        """
+        # 单个结果超过上限时不缓存
+        if len(content) > self.max_size:
+            return
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (content, mtime_ns, expires)
+            self.size += len(content)
+            while self.size > self.max_size and self._entries:
+                _, old = self._entries.popitem(last=False)
+                self.size -= len(old[0])
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_size': self.max_size,
+            }
+
+
+# 全局渲染结果缓存
+render_cache = RenderCache()
+
+
+def replace_template(app, path, _cache=None, **options):
     """
-    置换函数，读取模板文件，替换变量
+    置换函数，获取编译后的模板，替换变量
     :param app: 应用程序类
     :param path: 模板文件相对于 templates 的路径
+    :param _cache: 是否缓存渲染结果，为 True 时使用默认有效期，为数字时表示有效期秒数
     :param options: 参数字典
     """
 
+    # 获取模板文件本地路径
+    path = os.path.join(app.template_folder, path)
+
+    template = get_template(path)
     # 默认返回内容，当找不到本地模板文件时返回
-    content = '<h1>Not Found Tmeplate.</h1>'
+    if template is None:
+        return NOT_FOUND_CONTENT
+
+    if not _cache:
+        return template.render(options)
+
+    key = render_cache.make_key(path, options)
+    content = render_cache.get(key, template.mtime_ns)
+    if content is None:
+        content = template.render(options)
+        # bool 是 int 的子类，需要先排除 True
+        ttl = None if _cache is True else _cache
+        render_cache.put(key, template.mtime_ns, content, ttl)
+    return content
+
+
+def stream_replace_template(app, path, **options):
+    """
+    流式置换函数，返回逐块生成页面内容的生成器
+    :param app: 应用程序类
+    :param path: 模板文件相对于 templates 的路径
+    :param options: 参数字典
+    """
+
     # 获取模板文件本地路径
     path = os.path.join(app.template_folder, path)
 
-    # 如果路径存在，则开始解析置换
-    if os.path.exists(path):
-        with open(path, 'rb') as f:
-            content = f.read().decode()
-        # 解析出所有的标记
-        args = parse_args(content)
-        # 如果置换内容不为空，开始置换
-        if options:
-            for arg in args:
-                # 从标记中获取键
-                key = arg.strip()
-                # 如果键存在置换数据中，则进行数据替换，反之替换为空
-                old_value = '{{{{{}}}}}'.format(arg)  # 等价于 {{ arg }}
-                new_value = str(options.get(key, ''))
-                content = content.replace(old_value, new_value)
-    return content
\ No newline at end of file
+    template = get_template(path)
+    # 默认返回内容，当找不到本地模板文件时返回
+    if template is None:
+        return iter((NOT_FOUND_CONTENT,))
+    return template.stream(options)
@@ -1,10 +1,18 @@
+from sylfk import simple_template
+
+
 class View:
     """
     视图类的基类
     """
 
     methods = []  # 支持的请求方法列表
-    methods_meta = {}  # 请求方法与对应的方法的映射
+    methods_meta = {}  # 请求方法与对应的方法的映射，每个子类由 build_methods_meta 生成自己的映射表
+    # 视图实例是否可以在请求之间复用，默认每次请求创建新实例
+    # 复用的实例被所有线程共享，只有不在实例上保存请求状态的视图才能设置为 True
+    reuse_instance = False
+    # 通过 render 渲染模板时是否缓存渲染结果，可以为 True 或有效期秒数
+    template_cache = None
 
     def dispatch_request(self, request, *args, **options):
         """
@@ -12,20 +20,49 @@ class View:
         """
         raise NotImplementedError
 
+    def render(self, path, **options):
+        """
+        按视图类的 template_cache 设置渲染模板
+        """
+        return simple_template(path, _cache=self.template_cache, **options)
+
+    @classmethod
+    def build_methods_meta(cls):
+        """
+        生成请求方法与处理函数的映射表，如 {'GET': cls.get}
+        """
+        meta = {}
+        for method in cls.methods:
+            func = getattr(cls, method.lower(), None)
+            if func is not None:
+                meta[method] = func
+        cls.methods_meta = meta
+        return meta
+
     @classmethod
     def get_func(cls, name):
         """
         创建视图函数，参数 name 就是函数名
         """
-        def func(*args, **kw):
-            # 通过视图对象调用处理函数调度入口，返回视图处理结果
-            return cls().dispatch_request(*args, **kw)
+        # 请求方法映射表在创建视图函数时生成一次，请求时直接查表
+        cls.build_methods_meta()
+
+        if cls.reuse_instance:
+            # 无状态视图共用一个实例，省去每次请求的实例化开销
+            dispatch = cls().dispatch_request
+
+            def func(*args, **kw):
+                return dispatch(*args, **kw)
+        else:
+            def func(*args, **kw):
+                # 通过视图对象调用处理函数调度入口，返回视图处理结果
+                return cls().dispatch_request(*args, **kw)
 
         # 为视图函数绑定属性
         func.__name__ = name
         func.__doc__ = cls.__doc__
         func.__module__ = cls.__module__
-        func.methods = cls.methods
+        func.methods = frozenset(cls.methods)
 
         return func
 
@@ -1,7 +1,43 @@
 # WSGI 入口模块
+from werkzeug.http import parse_cookie
 from werkzeug.wrappers import Request
 
 
+class LazyRequest:
+    """
+    轻量请求对象，请求方法和路径直接从 environ 中读取
+    Cookie 在第一次访问时解析，args、form、data 等其他属性
+    在第一次访问时才创建 Werkzeug 的 Request 对象并交给它处理
+    """
+
+    def __init__(self, environ):
+        self.environ = environ
+        self.method = environ.get('REQUEST_METHOD', 'GET').upper()  # 请求方法
+        # 请求路径，WSGI 规定 PATH_INFO 以 latin-1 解码，这里还原为 UTF-8
+        self.path = environ.get('PATH_INFO', '').encode('latin-1') \
+            .decode('utf-8', 'replace') or '/'
+        self._cookies = None
+        self._request = None
+
+    @property
+    def cookies(self):
+        """请求附带的 Cookie，第一次访问时解析"""
+        if self._cookies is None:
+            self._cookies = parse_cookie(self.environ)
+        return self._cookies
+
+    @property
+    def request(self):
+        """完整的 Werkzeug 请求对象，第一次访问时创建"""
+        if self._request is None:
+            self._request = Request(self.environ)
+        return self._request
+
+    def __getattr__(self, name):
+        # 本类没有定义的属性交给 Werkzeug 的请求对象处理，如 args、form、data
+        return getattr(self.request, name)
+
+
 def wsgi_app(app, environ, start_responser):
     """
     处理请求的核心方法，每次服务器收到请求都会运行这个方法，
@@ -11,12 +47,10 @@ def wsgi_app(app, environ, start_responser):
     :param start_responser: Werkzeug 提供的进一步处理的函数
     """
 
-    request = Request(environ)
+    request = LazyRequest(environ)
     response = app.dispatch_request(request)
 
     # 调用响应对象的 __call__ 方法并返回
     # 此方法定义在 werkzeug.wrappers.base_response.BaseResponse 类中
     # 其作用是将响应对象返回给 Werkzeug 这个中间桥梁并由后者转发给客户端
     return response(environ, start_responser)
-
-
@@ -0,0 +1,39 @@
+# 无状态会话模式下，错误页面的共享响应体不能带上某个请求的会话 Cookie
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import Client
+
+from sylfk import ERROR_MAP, SYLFK, render_file
+from sylfk.session import session
+
+
+def test_error_page_does_not_leak_session_cookie():
+    session.set_cookie_mode('test-secret' * 4)
+    try:
+        app = SYLFK()
+
+        @app.route('/missing')
+        def missing(request):
+            session.push(request, 'user', 'alice')
+            return render_file('missing.txt')
+
+        @app.route('/plain')
+        def plain(request):
+            return render_file('missing.txt')
+
+        client = Client(app)
+        response = client.get('/missing')
+        assert response.status_code == 500
+        cookie = response.headers.get('Set-Cookie', '')
+        assert cookie.startswith('session=')
+
+        # 共享的错误响应体没有被修改，其它客户端拿不到这个会话
+        assert 'Set-Cookie' not in ERROR_MAP['2'].headers
+        other = Client(app).get('/plain')
+        assert other.status_code == 500
+        assert 'session=' not in other.headers.get('Set-Cookie', '')
+    finally:
+        session.cookie_secret = None